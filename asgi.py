@@ -0,0 +1,32 @@
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.routing import Mount
+from run import create_app as create_flask_app, start_background
+import os
+
+def create_app():
+    """
+    Async endpoints are served first, every other request goes to the Flask app in a thread pool
+    """
+    from routes.async_chat import async_chat_routes, TraceMiddleware
+    flask_app = create_flask_app()
+    app = Starlette(
+        routes=async_chat_routes + [
+            Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.environ.get('WSGI_THREADS', 32)))),
+        ],
+        # Flask requests are traced by the Flask app itself
+        middleware=[Middleware(TraceMiddleware, paths=[route.path for route in async_chat_routes])],
+    )
+    app.state.mydb = flask_app.mydb
+    app.state.slm = flask_app.slm
+    return app
+
+
+# Start the ASGI application if this script is executed directly
+# Production: gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker 'asgi:create_app()'
+if __name__ == '__main__':
+    import uvicorn
+    app = create_app()
+    start_background()
+    uvicorn.run(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,66 @@
+import os
+import random
+import resource
+import argparse
+import tempfile
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from config import load_config
+from models.SLM import load_embed_model
+from models.document_index import DocumentIndex
+
+# Ingestion throughput on a synthetic corpus, to size the machines that build the indexes
+WORDS = (
+    "model index vector query document token embedding latency throughput cache server request "
+    "answer context prompt summary video audio transcript worker process thread batch memory disk"
+).split()
+
+def write_corpus(folder, files, paragraphs, seed):
+    rng = random.Random(seed)
+    for i in range(files):
+        with open(os.path.join(folder, f"doc-{i:05d}.txt"), 'w') as f:
+            for _ in range(paragraphs):
+                sentences = [" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "." for _ in range(6)]
+                f.write(" ".join(sentences) + "\n\n")
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux, for children it is the largest parsing process
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+if __name__ == '__main__':
+    ingestion_config = load_config('config/slm.json').get('ingestion', {})
+    parser = argparse.ArgumentParser(description="Measure document ingestion throughput")
+    parser.add_argument('--files', type=int, default=500, help="Files in the synthetic corpus")
+    parser.add_argument('--paragraphs', type=int, default=20, help="Paragraphs per file")
+    parser.add_argument('--parse-workers', type=int, default=ingestion_config.get('parse_workers', 1))
+    parser.add_argument('--embed-batch-size', type=int, default=ingestion_config.get('embed_batch_size', 32))
+    parser.add_argument('--embed-threads', type=int, default=ingestion_config.get('embed_threads'))
+    parser.add_argument('--vector-store', choices=['simple', 'mmap'], default='mmap')
+    parser.add_argument('--mock-embeddings', action='store_true', help="Skip the embedding model to measure parsing and storage only")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mock_embeddings:
+        Settings.embed_model = MockEmbedding(embed_dim=384)
+    else:
+        load_embed_model({'embed_batch_size': args.embed_batch_size, 'embed_threads': args.embed_threads})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_folder = os.path.join(tmp_dir, 'data')
+        os.makedirs(data_folder)
+        write_corpus(data_folder, args.files, args.paragraphs, args.seed)
+        document_index = DocumentIndex(
+            data_folder, os.path.join(tmp_dir, 'index'), {'type': args.vector_store}, parse_workers=args.parse_workers
+        )
+
+        stats = document_index.refresh()
+
+    own_rss, children_rss = peak_rss_mib()
+    print(f"files={args.files} parse_workers={args.parse_workers} embed_batch_size={args.embed_batch_size} embed_threads={args.embed_threads}")
+    print(f"documents={stats['documents']} chunks={stats['chunks']} total={stats['seconds']:.2f}s")
+    print(f"parse: {stats['parse_seconds']:.2f}s, {stats['documents'] / max(stats['parse_seconds'], 1e-9):.1f} documents/s")
+    print(f"chunk+embed: {stats['embed_seconds']:.2f}s, {stats['chunks'] / max(stats['embed_seconds'], 1e-9):.1f} chunks/s")
+    print(f"overall: {stats['documents'] / stats['seconds']:.1f} documents/s, {stats['chunks'] / stats['seconds']:.1f} chunks/s")
+    print(f"peak RSS: {own_rss:.0f} MiB, largest parsing process {children_rss:.0f} MiB")
@@ -0,0 +1,82 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from config import load_config
+from models.SLM import load_embed_model
+from models.document_index import DocumentIndex
+
+# Recall and latency of dense, hybrid and BM25 prefiltered retrieval for questions about exact codes
+TOPICS = [
+    "The pump controller restarts when the supply voltage drops below the threshold.",
+    "Firmware updates are applied during the maintenance window and verified with a checksum.",
+    "The sensor module reports temperature and humidity every few seconds over the bus.",
+    "Calibration must be repeated after replacing the valve assembly or the pressure gauge.",
+    "The display shows a warning and the device enters safe mode until it is reset.",
+]
+
+def write_corpus(folder, files, seed):
+    """
+    Every file documents one part number and one error code, returns [(code, file name)]
+    """
+    rng = random.Random(seed)
+    codes = []
+    for i in range(files):
+        part = f"XR-{rng.randint(1000, 9999)}-{rng.choice('ABCDEFGH')}"
+        error = f"E{i:05d}"
+        name = f"manual-{i:05d}.txt"
+        paragraphs = [" ".join(rng.sample(TOPICS, 3)) for _ in range(4)]
+        paragraphs.insert(rng.randint(0, 4), f"Part {part} reports error {error} when {rng.choice(TOPICS).lower()}")
+        with open(os.path.join(folder, name), 'w') as f:
+            f.write("\n\n".join(paragraphs))
+        codes.append((error, name))
+    return codes
+
+if __name__ == '__main__':
+    retrieval_config = load_config('config/slm.json').get('retrieval_cache', {})
+    parser = argparse.ArgumentParser(description="Compare dense, hybrid and prefiltered retrieval")
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=retrieval_config.get('similarity_top_k', 2))
+    parser.add_argument('--candidates', type=int, default=retrieval_config.get('candidates', 10))
+    parser.add_argument('--mock-embeddings', action='store_true', help="Skip the embedding model, dense results are then random")
+    parser.add_argument('--quiet', action='store_true', help="Only print the summary, not every query")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mock_embeddings:
+        Settings.embed_model = MockEmbedding(embed_dim=384)
+    else:
+        load_embed_model()
+
+    modes = ['dense', 'hybrid', 'prefilter']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_folder = os.path.join(tmp_dir, 'data')
+        os.makedirs(data_folder)
+        codes = write_corpus(data_folder, args.files, args.seed)
+        document_index = DocumentIndex(data_folder, os.path.join(tmp_dir, 'index'), {'type': 'mmap'})
+        print(f"Indexed {args.files} files: {document_index.refresh()}")
+
+        results = {mode: {'hits': [], 'ms': []} for mode in modes}
+        for error, name in random.Random(args.seed).sample(codes, min(args.queries, len(codes))):
+            query = f"What does error {error} mean?"
+            embedding = Settings.embed_model.get_query_embedding(query)
+            line = [f"{query:<32}"]
+            for mode in modes:
+                start = time.perf_counter()
+                nodes, timings = document_index.search(query, embedding, args.top_k, mode=mode, candidates=args.candidates)
+                elapsed = (time.perf_counter() - start) * 1000
+                hit = any(error in node.node.get_content() for node in nodes)
+                results[mode]['hits'].append(hit)
+                results[mode]['ms'].append(elapsed)
+                line.append(f"{mode}={'hit ' if hit else 'miss'} {elapsed:6.2f}ms {timings}")
+            if not args.quiet:
+                print("  ".join(line))
+
+    for mode in modes:
+        ms = np.array(results[mode]['ms'])
+        print(f"{mode:<10} recall@{args.top_k}={np.mean(results[mode]['hits']):.3f}  mean={ms.mean():.2f}ms  p95={np.percentile(ms, 95):.2f}ms")
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from models.vector_store import MmapVectorStore
+
+# Recall and latency of the vector stores on synthetic embeddings, the default store gives the exact results
+def synthetic_embeddings(count, dim, clusters, seed):
+    """
+    Clustered unit vectors, closer to real sentence embeddings than uniform noise
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def run(name, store, queries, top_k, truth=None):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k))
+        latencies.append(time.perf_counter() - start)
+        results.append(result.ids)
+    latencies = np.array(latencies) * 1000
+    recall = 1.0 if truth is None else np.mean([len(set(r) & set(t)) / top_k for r, t in zip(results, truth)])
+    print(f"{name:<14} recall@{top_k}={recall:.4f}  p50={np.percentile(latencies, 50):.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the default vector store with the memory-mapped one")
+    parser.add_argument('--vectors', type=int, default=50000, help="Number of stored embeddings")
+    parser.add_argument('--dim', type=int, default=384, help="Embedding size, 384 for all-MiniLM-L6-v2")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=2)
+    parser.add_argument('--clusters', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.vectors, args.dim, args.clusters, args.seed)
+    queries = synthetic_embeddings(args.queries, args.dim, args.clusters, args.seed + 1)
+    nodes = [TextNode(id_=str(i), text="", embedding=vector.tolist()) for i, vector in enumerate(vectors)]
+    print(f"{args.vectors} vectors of {args.dim} dimensions, {args.queries} queries")
+
+    start = time.perf_counter()
+    simple = SimpleVectorStore()
+    simple.add(nodes)
+    # Every float of a Python list is a 24 bytes object plus an 8 bytes pointer
+    list_bytes = sum(sys.getsizeof(node.embedding) + 24 * args.dim for node in nodes)
+    print(f"simple         built in {time.perf_counter() - start:.2f}s, ~{list_bytes / 2**20:.1f} MiB of vectors")
+    truth = run('simple', simple, queries, args.top_k)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for quantize in (False, True):
+            name = 'mmap-int8' if quantize else 'mmap-float32'
+            persist_path = os.path.join(tmp_dir, f"{name}.json")
+            start = time.perf_counter()
+            store = MmapVectorStore(quantize=quantize)
+            store.add(nodes)
+            store.persist(persist_path)
+            store = MmapVectorStore.from_persist_path(persist_path)
+            print(f"{name:<14} built in {time.perf_counter() - start:.2f}s, {store.nbytes / 2**20:.1f} MiB of vectors")
+            run(name, store, queries, args.top_k, truth)
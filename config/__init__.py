@@ -1,6 +1,6 @@
 import json
 
-def load_config():
-    with open('config/config.json','r') as f:
+def load_config(path='config/config.json'):
+    with open(path,'r') as f:
         config = json.load(f)
     return config
\ No newline at end of file
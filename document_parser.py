@@ -0,0 +1,18 @@
+import os
+from llama_index.core import SimpleDirectoryReader
+
+# Runs in the parsing worker processes: they are spawned and import this module by name,
+# importing the models package there would load the whole app (torch, transformers) in every worker
+
+def parse_file(data_folder:str, name:str, cwd:str):
+    """
+    Parse one file into documents with stable ids so they can be deleted later
+    """
+    documents = SimpleDirectoryReader(input_files=[os.path.join(data_folder, name)]).load_data()
+
+    # Limit metadata to current folder
+    for idx, doc in enumerate(documents):
+        doc.id_ = f"{name}#{idx}"
+        fp = doc.metadata['file_path']
+        doc.metadata['file_path'] = os.path.relpath(fp, cwd)
+    return documents
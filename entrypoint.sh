@@ -3,7 +3,22 @@
 # Start the ollama service in the background
 nohup ollama start &> /var/log/ollama/ollama.log &
 
-# Wait a bit to ensure the service starts properly
-sleep 10
+# Wait until the ollama API answers instead of a fixed sleep
+for i in $(seq 1 60); do
+    curl -sf http://localhost:11434/api/tags > /dev/null && break
+    sleep 0.5
+done
 
-python3 run.py
\ No newline at end of file
+# Metrics of a previous run must not be merged into the new ones
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# SERVER_MODE=development runs the Flask debug server
+# SERVER_MODE=async serves /stream-send with asyncio, the other endpoints with Flask
+case "${SERVER_MODE:-production}" in
+    development) exec python3 run.py ;;
+    async) exec gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker 'asgi:create_app()' ;;
+    *) exec gunicorn -c gunicorn.conf.py 'run:create_app()' ;;
+esac
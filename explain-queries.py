@@ -0,0 +1,110 @@
+import argparse
+import mysql.connector
+
+# Queries run by the stored procedures, with the values used to EXPLAIN them
+QUERIES = {
+    'VerifyToken': (
+        """SELECT COUNT(*) FROM tokens t JOIN user_credentials u ON t.user_id = u.user_id
+        WHERE t.token = %(token)s AND u.email = %(email)s AND t.valid = TRUE AND t.expires_at > NOW()"""
+    ),
+    'DeleteToken': (
+        """DELETE FROM tokens WHERE token = %(token)s
+        AND user_id = (SELECT user_id FROM user_credentials WHERE email = %(email)s)"""
+    ),
+    'CreateToken cleanup': (
+        """DELETE FROM tokens WHERE user_id = %(user_id)s AND expires_at < NOW()"""
+    ),
+    'PurgeExpiredTokens': (
+        """DELETE FROM tokens WHERE expires_at < NOW() LIMIT 5000"""
+    ),
+    'ReadChatHistory': (
+        """SELECT c.conversation_id, c.title, c.created_at FROM chat_history c
+        JOIN user_credentials u ON c.user_id = u.user_id WHERE u.email = %(email)s ORDER BY c.created_at"""
+    ),
+}
+
+# Secondary indexes of init.sql, created on databases initialized before they existed
+INDEXES = [
+    ('tokens', 'idx_tokens_token', '(token)'),
+    ('tokens', 'idx_tokens_user_expires', '(user_id, expires_at)'),
+    ('tokens', 'idx_tokens_expires_at', '(expires_at)'),
+    ('chat_history', 'idx_chat_history_user_created', '(user_id, created_at)'),
+]
+
+PURGE_EVENT = """
+CREATE EVENT IF NOT EXISTS PurgeExpiredTokens
+ON SCHEDULE EVERY 1 HOUR
+DO
+BEGIN
+    REPEAT
+        DELETE FROM tokens WHERE expires_at < NOW() LIMIT 5000;
+    UNTIL ROW_COUNT() = 0 END REPEAT;
+END
+"""
+
+def sample_params(cursor):
+    """
+    Use a real token when there is one so the plans reflect actual data
+    """
+    cursor.execute("SELECT t.token, u.email, u.user_id FROM tokens t JOIN user_credentials u ON t.user_id = u.user_id LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        return {'token': 'no-token', 'email': 'no-user@example.com', 'user_id': 0}
+    return {'token': row[0], 'email': row[1], 'user_id': row[2]}
+
+def explain_all(cursor, params):
+    """
+    Returns {query name: [(table, type, key, rows, extra)]}
+    """
+    plans = {}
+    for name, query in QUERIES.items():
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [c[0] for c in cursor.description]
+        plans[name] = [
+            (row['table'], row['type'], row['key'], row['rows'], row['Extra'])
+            for row in (dict(zip(columns, r)) for r in cursor.fetchall())
+        ]
+    return plans
+
+def apply_schema(cursor):
+    """
+    Create missing indexes and the purge event, safe to run more than once
+    """
+    for table, index_name, columns in INDEXES:
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+            (table, index_name)
+        )
+        if cursor.fetchone()[0] == 0:
+            print(f"Creating index {index_name} on {table}{columns}")
+            cursor.execute(f"CREATE INDEX {index_name} ON {table} {columns}")
+    cursor.execute(PURGE_EVENT)
+
+def print_plans(title, plans):
+    print(f"\n{title}")
+    for name, rows in plans.items():
+        print(f"  {name}")
+        for table, access_type, key, rows_examined, extra in rows:
+            print(f"    table={table} type={access_type} key={key} rows={rows_examined} extra={extra}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report query plans of the chat_system procedures before and after adding the schema indexes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root', help="User with SELECT and INDEX privileges, db_user can only execute procedures")
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--database', default='chat_system')
+    parser.add_argument('--apply', action='store_true', help="Create the missing indexes and purge event between both reports")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(host=args.host, port=args.port, user=args.user, password=args.password, database=args.database)
+    try:
+        with conn.cursor(buffered=True) as cursor:
+            params = sample_params(cursor)
+            print_plans("Before", explain_all(cursor, params))
+            if args.apply:
+                apply_schema(cursor)
+                conn.commit()
+                print_plans("After", explain_all(cursor, params))
+    finally:
+        conn.close()
@@ -1,4 +1,7 @@
 from models import *
 
+# Download the models at build time, they are loaded lazily by the app
 slm = SLM(model_name = 'llama3.2')
-print(slm)
\ No newline at end of file
+for thread in slm.warmup():
+    thread.join()
+print(slm.status())
@@ -0,0 +1,42 @@
+# Production server settings: gunicorn -c gunicorn.conf.py 'run:create_app()'
+# Every value can be overridden with the environment variables below.
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Streams spend their time waiting on ollama, one thread each is cheap compared to a process.
+# Each worker process holds its own copy of the models unless PRELOAD_MODELS is set.
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 256))
+
+# gthread workers heartbeat from their main loop, long streams do not trip the timeout
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# On SIGTERM workers stop accepting connections and open streams get this long to finish
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Import the app once in the master, workers are forked from it
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+def when_ready(server):
+    # Load the models in the master so workers share the weights copy-on-write.
+    # CPU only: CUDA can not be used in a process forked after it was initialised.
+    if os.environ.get('PRELOAD_MODELS') == '1':
+        from run import create_app
+        app = create_app()
+        for thread in app.slm.warmup():
+            thread.join()
+        server.log.info(f"Models preloaded: {app.slm.status()}")
+
+def post_fork(server, worker):
+    # Threads started in the master do not survive the fork
+    from run import start_background
+    start_background()
+
+def worker_exit(server, worker):
+    from run import stop_background
+    stop_background()
@@ -0,0 +1,31 @@
+import os
+import argparse
+from config import load_config
+from models.SLM import load_embed_model
+from models.document_index import DocumentIndex, IndexWatcher
+
+# Incremental ingestion of a data folder, only new or modified files are embedded
+if __name__ == '__main__':
+    slm_config = load_config('config/slm.json')
+    parser = argparse.ArgumentParser(description="Update the persisted document index of a data folder")
+    parser.add_argument('--data-folder', default=os.path.join(os.getcwd(),'data'), help="Folder with the documents to index")
+    parser.add_argument('--watch', action='store_true', help="Keep running and refresh the index periodically")
+    parser.add_argument('--interval', type=float, default=slm_config['index_watch_interval'], help="Seconds between refreshes when watching")
+    args = parser.parse_args()
+
+    ingestion_config = slm_config.get('ingestion', {})
+    load_embed_model(ingestion_config)
+    document_index = DocumentIndex.for_folder(
+        args.data_folder, slm_config['index_dir'], slm_config.get('vector_store'),
+        parse_workers=ingestion_config.get('parse_workers', 1)
+    )
+
+    if args.watch:
+        watcher = IndexWatcher(document_index, args.interval)
+        watcher.start()
+        try:
+            watcher.join()
+        except KeyboardInterrupt:
+            watcher.stop()
+    else:
+        print(document_index.refresh())
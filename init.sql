@@ -26,7 +26,10 @@ CREATE TABLE IF NOT EXISTS tokens (
     expires_at TIMESTAMP NOT NULL,  -- Expiration time for token
     issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- When the token was issued
     valid BOOLEAN DEFAULT TRUE,  -- Token validity flag
-    CONSTRAINT fk_user_id FOREIGN KEY (user_id) REFERENCES user_credentials(user_id) ON DELETE CASCADE  -- Delete tokens when user is deleted
+    CONSTRAINT fk_user_id FOREIGN KEY (user_id) REFERENCES user_credentials(user_id) ON DELETE CASCADE,  -- Delete tokens when user is deleted
+    INDEX idx_tokens_token (token),  -- VerifyToken and DeleteToken look tokens up by value
+    INDEX idx_tokens_user_expires (user_id, expires_at),  -- CreateToken deletes the expired tokens of a user
+    INDEX idx_tokens_expires_at (expires_at)  -- PurgeExpiredTokens deletes expired tokens of every user
 );
 
 -- Create chat history table to store user conversations
@@ -38,7 +41,19 @@ CREATE TABLE IF NOT EXISTS chat_history (
     chat_content JSON NOT NULL,  -- Store chat data as JSON
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Timestamp for when the conversation was created
     FOREIGN KEY (user_id) REFERENCES user_credentials(user_id) ON DELETE CASCADE,  -- Delete chat history when user is deleted
-    UNIQUE (conversation_id)  -- Ensure conversation_id is unique
+    UNIQUE (conversation_id),  -- Ensure conversation_id is unique
+    INDEX idx_chat_history_user_created (user_id, created_at)  -- ReadChatHistory lists conversations of a user by date
+);
+
+-- Create chat messages table to store conversations one message per row, new messages are appended
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id BIGINT AUTO_INCREMENT PRIMARY KEY,  -- Unique identifier for each message, also gives the message order
+    chat_id INT NOT NULL,  -- Foreign key linking to the conversation
+    role VARCHAR(16) NOT NULL,  -- Role of the author of the message (user, assistant)
+    content MEDIUMTEXT NOT NULL,  -- Message text
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Timestamp for when the message was added
+    FOREIGN KEY (chat_id) REFERENCES chat_history(chat_id) ON DELETE CASCADE,  -- Delete messages when the conversation is deleted
+    INDEX idx_chat_messages_chat (chat_id, message_id)  -- Read the last messages of a conversation without sorting
 );
 
 
@@ -215,6 +230,37 @@ BEGIN
     END IF;
 END //
 
+-- Procedure to verify a token like VerifyToken and also return how long it remains valid, used to cache verifications
+CREATE PROCEDURE VerifyTokenExpiry (
+    IN in_email VARCHAR(255),  -- Email for additional verification
+    IN in_token VARCHAR(512),  -- Token to be verified
+    OUT out_op_status BOOLEAN, -- Output flag indicating if the token is valid
+    OUT out_seconds_left INT   -- Seconds until the token expires, NULL if it is not valid
+)
+BEGIN
+    DECLARE token_expires_at TIMESTAMP DEFAULT NULL;
+
+    -- Check if the token is valid, not expired, and belongs to the correct user
+    SELECT t.expires_at
+    INTO token_expires_at
+    FROM tokens t
+    JOIN user_credentials u ON t.user_id = u.user_id
+    WHERE t.token = in_token
+    AND u.email = in_email  -- Ensure the email matches the user associated with the token
+    AND t.valid = TRUE
+    AND t.expires_at > NOW()  -- Token should not be expired
+    LIMIT 1;
+
+    -- Set output flags based on whether a valid token was found
+    IF token_expires_at IS NOT NULL THEN
+        SET out_op_status = TRUE;  -- Token is valid
+        SET out_seconds_left = TIMESTAMPDIFF(SECOND, NOW(), token_expires_at);
+    ELSE
+        SET out_op_status = FALSE;  -- Token is invalid or expired
+        SET out_seconds_left = NULL;
+    END IF;
+END //
+
 -- Procedure to delete a token when the user logs out, ensuring both token and email match
 CREATE PROCEDURE DeleteToken (
     IN in_email VARCHAR(255),  -- User's email for validation
@@ -257,25 +303,16 @@ CREATE PROCEDURE ReadChatHistory (
     OUT out_op_status BOOLEAN     -- Output flag indicating if the chat history was read successfully
 )
 BEGIN
-    DECLARE history_count INT;
-
     -- Verify the token and email
     CALL VerifyToken(in_email, in_token, out_token_valid);
 
-    -- If token and email are valid, check for and return the user's chat history
+    -- If token and email are valid, return the user's chat history, an empty result is still a successful read
     IF out_token_valid THEN
-        -- First, check if there's any chat history
-        SELECT COUNT(*) INTO history_count
-        FROM chat_history c
-        JOIN user_credentials u ON c.user_id = u.user_id
-        WHERE u.email = in_email;
-
-        -- Set out_op_status based on whether any chat history was found
-        -- Chat history found, return it
         SELECT c.conversation_id, c.title, c.created_at
         FROM chat_history c
         JOIN user_credentials u ON c.user_id = u.user_id
-        WHERE u.email = in_email;  -- Ensure email matches
+        WHERE u.email = in_email  -- Ensure email matches
+        ORDER BY c.created_at;  -- Served by idx_chat_history_user_created
 
         SET out_op_status = TRUE;  -- Chat history read successfully
     ELSE
@@ -393,6 +430,118 @@ BEGIN
     END IF;
 END //
 
+-- Procedure to update the title of a conversation for a user with a valid token and matching email
+CREATE PROCEDURE UpdateConversationTitle (
+    IN in_email VARCHAR(255),           -- User's email for validation
+    IN in_token VARCHAR(512),           -- User's token for validation
+    IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+    IN in_title VARCHAR(50),            -- New title for the conversation
+    OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+    OUT out_op_status BOOLEAN           -- Output flag indicating if the title was updated successfully
+)
+BEGIN
+    -- Verify the token and email
+    CALL VerifyToken(in_email, in_token, out_token_valid);
+
+    -- If token and email are valid, update the title
+    IF out_token_valid THEN
+        UPDATE chat_history c
+        JOIN user_credentials u ON c.user_id = u.user_id
+        SET c.title = in_title
+        WHERE u.email = in_email
+        AND c.conversation_id = in_conversation_id;
+
+        SET out_op_status = (ROW_COUNT() > 0);  -- Title updated successfully
+    ELSE
+        SET out_op_status = FALSE;  -- Invalid token, title not updated
+    END IF;
+END //
+
+-- Procedure to append one message to a conversation for a user with a valid token and matching email
+CREATE PROCEDURE AppendMessage (
+    IN in_email VARCHAR(255),           -- User's email for validation
+    IN in_token VARCHAR(512),           -- User's token for validation
+    IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+    IN in_role VARCHAR(16),             -- Role of the author of the message
+    IN in_content MEDIUMTEXT,           -- Message text
+    OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+    OUT out_op_status BOOLEAN           -- Output flag indicating if the message was appended successfully
+)
+BEGIN
+    DECLARE retrieved_chat_id INT;
+
+    -- Verify the token and email
+    CALL VerifyToken(in_email, in_token, out_token_valid);
+
+    -- If token and email are valid, insert the message in the conversation
+    IF out_token_valid THEN
+        SELECT c.chat_id INTO retrieved_chat_id
+        FROM chat_history c
+        JOIN user_credentials u ON c.user_id = u.user_id
+        WHERE u.email = in_email
+        AND c.conversation_id = in_conversation_id;
+
+        IF retrieved_chat_id IS NULL THEN
+            SET out_op_status = FALSE;  -- Conversation not found
+        ELSE
+            INSERT INTO chat_messages (chat_id, role, content)
+            VALUES (retrieved_chat_id, in_role, in_content);
+
+            SET out_op_status = (ROW_COUNT() > 0);  -- Message appended successfully
+        END IF;
+    ELSE
+        SET out_op_status = FALSE;  -- Invalid token, message not appended
+    END IF;
+END //
+
+-- Procedure to read the last messages of a conversation for a user with a valid token and matching email
+CREATE PROCEDURE ReadLastMessages (
+    IN in_email VARCHAR(255),           -- User's email for validation
+    IN in_token VARCHAR(512),           -- User's token for validation
+    IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+    IN in_limit INT,                    -- Number of messages to read, NULL reads the whole conversation
+    OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+    OUT out_op_status BOOLEAN           -- Output flag indicating if the messages were read successfully
+)
+BEGIN
+    DECLARE retrieved_chat_id INT;
+    DECLARE message_limit INT DEFAULT 2147483647;  -- LIMIT only accepts variables, not expressions
+
+    -- Verify the token and email
+    CALL VerifyToken(in_email, in_token, out_token_valid);
+
+    -- If token and email are valid, return the messages oldest first
+    IF out_token_valid THEN
+        SELECT c.chat_id INTO retrieved_chat_id
+        FROM chat_history c
+        JOIN user_credentials u ON c.user_id = u.user_id
+        WHERE u.email = in_email
+        AND c.conversation_id = in_conversation_id;
+
+        IF retrieved_chat_id IS NULL THEN
+            SET out_op_status = FALSE;  -- Conversation not found
+        ELSE
+            IF in_limit IS NOT NULL THEN
+                SET message_limit = in_limit;
+            END IF;
+
+            SELECT m.role, m.content
+            FROM (
+                SELECT message_id, role, content
+                FROM chat_messages
+                WHERE chat_id = retrieved_chat_id
+                ORDER BY message_id DESC
+                LIMIT message_limit
+            ) m
+            ORDER BY m.message_id ASC;
+
+            SET out_op_status = TRUE;
+        END IF;
+    ELSE
+        SET out_op_status = FALSE;  -- Invalid token, messages not read
+    END IF;
+END //
+
 -- Procedure to delete chat history for a user with a valid token and matching email
 CREATE PROCEDURE DeleteConversation (
     IN in_email VARCHAR(255),           -- User's email for validation
@@ -420,6 +569,22 @@ BEGIN
     END IF;
 END //
 
+
+
+
+
+-- Maintenance
+-- Event to purge expired tokens of every user, CreateToken only cleans the tokens of the user logging in
+-- Rows are deleted in batches to keep locks short
+CREATE EVENT IF NOT EXISTS PurgeExpiredTokens
+ON SCHEDULE EVERY 1 HOUR
+DO
+BEGIN
+    REPEAT
+        DELETE FROM tokens WHERE expires_at < NOW() LIMIT 5000;
+    UNTIL ROW_COUNT() = 0 END REPEAT;
+END //
+
 DELIMITER ;
 
 
@@ -459,6 +624,11 @@ PREPARE stmt FROM @grant_execute_procedure;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.VerifyTokenExpiry TO ''', @db_user, '''@''', @db_host, ''';');
+PREPARE stmt FROM @grant_execute_procedure;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.DeleteToken TO ''', @db_user, '''@''', @db_host, ''';');
 PREPARE stmt FROM @grant_execute_procedure;
 EXECUTE stmt;
@@ -484,6 +654,21 @@ PREPARE stmt FROM @grant_execute_procedure;
 EXECUTE stmt;
 DEALLOCATE PREPARE stmt;
 
+SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.UpdateConversationTitle TO ''', @db_user, '''@''', @db_host, ''';');
+PREPARE stmt FROM @grant_execute_procedure;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.AppendMessage TO ''', @db_user, '''@''', @db_host, ''';');
+PREPARE stmt FROM @grant_execute_procedure;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.ReadLastMessages TO ''', @db_user, '''@''', @db_host, ''';');
+PREPARE stmt FROM @grant_execute_procedure;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
 SET @grant_execute_procedure = CONCAT('GRANT EXECUTE ON PROCEDURE chat_system.DeleteConversation TO ''', @db_user, '''@''', @db_host, ''';');
 PREPARE stmt FROM @grant_execute_procedure;
 EXECUTE stmt;
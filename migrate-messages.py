@@ -0,0 +1,55 @@
+import argparse
+import mysql.connector
+
+# Conversations stored before chat_messages existed only have their JSON chat_content.
+# Their messages are copied to chat_messages once, in order, by a single statement in one transaction.
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    chat_id INT NOT NULL,
+    role VARCHAR(16) NOT NULL,
+    content MEDIUMTEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (chat_id) REFERENCES chat_history(chat_id) ON DELETE CASCADE,
+    INDEX idx_chat_messages_chat (chat_id, message_id)
+)
+"""
+
+# Conversations that already have messages are skipped, running it again copies nothing
+MIGRATE_MESSAGES = """
+INSERT INTO chat_messages (chat_id, role, content)
+SELECT c.chat_id, j.role, j.content
+FROM chat_history c
+JOIN JSON_TABLE(
+    c.chat_content, '$[*]' COLUMNS (
+        position FOR ORDINALITY,
+        role VARCHAR(16) PATH '$.role',
+        content MEDIUMTEXT PATH '$.content'
+    )
+) j
+WHERE NOT EXISTS (SELECT 1 FROM chat_messages m WHERE m.chat_id = c.chat_id)
+ORDER BY c.chat_id, j.position
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copy the messages of conversations stored as JSON to chat_messages, run it before starting the app")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root', help="User with CREATE, SELECT and INSERT privileges, db_user can only execute procedures")
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--database', default='chat_system')
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(host=args.host, port=args.port, user=args.user, password=args.password, database=args.database)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_TABLE)
+            # Autocommit is off, the copy is committed at once or rolled back
+            cursor.execute(MIGRATE_MESSAGES)
+            conn.commit()
+            print(f"Copied {cursor.rowcount} messages to chat_messages")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
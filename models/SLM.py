@@ -1,104 +1,329 @@
 import ollama
 import os
+import asyncio
 import re
-import json
-from pytube import YouTube
+import time
+import hashlib
+import numpy as np
+import torch
 from transformers import pipeline
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from werkzeug.utils import secure_filename
+from llama_index.core import Settings
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.ollama import Ollama
-from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.core.llms import ChatMessage
+from .components import LazyComponent
+from .audio import SAMPLING_RATE, decode_audio, iter_audio_windows, merge_overlap
+from .document_index import DocumentIndex
+from .index_registry import IndexRegistry
+from .video_cache import VideoCache
+from .youtube import VideoPipeline
+from .summarizer import MapReduceSummarizer
+from .transcription import TranscriptionService
+from .llm_scheduler import LLMScheduler, BACKGROUND
+from .retrieval_cache import RetrievalCache
+from .response_cache import ResponseCache
+from .prompt_builder import PromptBuilder
+from .metrics import span, annotate, log, GenerationTimer
+
+SYSTEM_PROMPT = "You are my helpful assitant"
 
 class Speech2Text:
-    def __init__(self,model_name="openai/whisper-tiny",device='cuda'):
-        try:
-            self.pipe = pipeline("automatic-speech-recognition", model=model_name, device = 'cuda')
-        except:
-            print("No cuda found, falling back to cpu")
-            self.pipe = pipeline("automatic-speech-recognition", model=model_name, device = 'cpu')
+    def __init__(self,model_name="openai/whisper-tiny",device='cuda',window_seconds=30,overlap_seconds=2):
+        """
+        The Whisper pipeline is loaded on first use or by warming its component
+        """
+        self.model_name = model_name
+        self.device = device
+        self.component = LazyComponent('whisper', self.load_pipeline)
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+
+    def load_pipeline(self):
+        device = self.device
+        if device == 'cuda' and not torch.cuda.is_available():
+            log('whisper_device_fallback', requested='cuda', device='cpu', reason="No cuda found")
+            device = 'cpu'
+        return pipeline("automatic-speech-recognition", model=self.model_name, device = device)
+
+    @property
+    def pipe(self):
+        return self.component.get()
+
+    @staticmethod
+    def to_input(audio):
+        """
+        Pipeline input for a file path, bytes, a file-like object or an already decoded float32 buffer
+        """
+        if isinstance(audio, (str, dict)):
+            return audio
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio)
+        return {'raw': audio, 'sampling_rate': SAMPLING_RATE}
     
-    def get_transcript(self,file_path):
-        return self.pipe(file_path)['text']
+    def get_transcript(self,audio):
+        with span('whisper'):
+            return self.pipe(self.to_input(audio))['text']
+
+    def get_transcripts(self,inputs):
+        """
+        Transcribe several inputs with one batched pipeline call
+        """
+        with span('whisper'):
+            return [output['text'] for output in self.pipe([self.to_input(audio) for audio in inputs], batch_size=len(inputs))]
+
+    def stream_transcript(self,audio,transcribe_window=None):
+        """
+        Transcribe long audio in overlapping windows, yields the new text of every window as soon as it is ready.
+        Audio is decoded while it is transcribed so memory stays bounded by the window size.
+        transcribe_window replaces the direct pipeline call, e.g. to go through the batching queue.
+        """
+        previous_words = []
+        for window in iter_audio_windows(audio, self.window_seconds, self.overlap_seconds):
+            if transcribe_window is None:
+                with span('whisper'):
+                    text = self.pipe({'raw': window, 'sampling_rate': SAMPLING_RATE})['text']
+            else:
+                text = transcribe_window(window)
+            text = merge_overlap(previous_words, text)
+            previous_words = (previous_words + text.split())[-100:]
+            if text:
+                yield text
+
+    def get_long_transcript(self,audio):
+        return " ".join(self.stream_transcript(audio))
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+def load_embed_model(config:dict = None):
+    """
+    Create the embedding model and make it the default of llama_index
+    Config: "ingestion" section of config/slm.json
+        - embed_batch_size: chunks embedded per forward pass
+        - embed_threads: torch CPU threads, shared with Whisper, unset keeps the torch default
+    """
+    config = config or {}
+    if config.get('embed_threads'):
+        torch.set_num_threads(config['embed_threads'])
+    Settings.embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME, embed_batch_size=config.get('embed_batch_size', 32))
+    return Settings.embed_model
 
 class SLM:
-    def __init__(self,model_name,):
+    def __init__(self,model_name,config=None):
+        """
+        Config is the content of config/slm.json, every setting has a default
+        """
         self.model_name=model_name
-        self.audio_model = Speech2Text()
-        Settings.embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        Settings.llm = Ollama(model=self.model_name, request_timeout=360.0)
-    
-    def prompt(self,chat_history,stream):
-        return ollama.chat(model=self.model_name,messages=chat_history,stream=stream)
+        self.config = config or {}
+        self.index_dir = self.config.get('index_dir', 'storage/index')
+        collections_config = self.config.get('collections', {})
+        self.collections_dir = collections_config.get('path', 'storage/collections')
+        self.document_indexes = IndexRegistry(
+            max_open=collections_config.get('max_open_indexes', 16),
+            max_open_bytes=collections_config.get('max_open_mb', 512) * 1024 * 1024
+        )
+        video_cache_config = self.config.get('video_cache', {})
+        self.video_cache = VideoCache(
+            path=video_cache_config.get('path', 'storage/cache/videos.sqlite3'),
+            max_bytes=video_cache_config.get('max_mb', 256) * 1024 * 1024
+        )
+        transcription_config = self.config.get('transcription', {})
+        self.audio_model = Speech2Text(
+            window_seconds=transcription_config.get('window_seconds', 30),
+            overlap_seconds=transcription_config.get('overlap_seconds', 2)
+        )
+        self.transcriber = TranscriptionService(
+            self.audio_model,
+            max_batch_size=transcription_config.get('max_batch_size', 8),
+            max_wait_ms=transcription_config.get('max_wait_ms', 50)
+        )
+        video_pipeline_config = self.config.get('video_pipeline', {})
+        self.video_pipeline = VideoPipeline(
+            self.audio_model,
+            max_workers=video_pipeline_config.get('max_workers', 4),
+            max_transcriptions=video_pipeline_config.get('max_transcriptions', 1)
+        )
+        retrieval_cache_config = self.config.get('retrieval_cache', {})
+        self.retrieval_cache = RetrievalCache(
+            embedding_cache_size=retrieval_cache_config.get('embedding_cache_size', 1024),
+            retrieval_cache_size=retrieval_cache_config.get('retrieval_cache_size', 256),
+            similarity_top_k=retrieval_cache_config.get('similarity_top_k', 2),
+            mode=retrieval_cache_config.get('mode', 'dense'),
+            candidates=retrieval_cache_config.get('candidates', 10),
+            rrf_k=retrieval_cache_config.get('rrf_k', 60)
+        )
+        response_cache_config = self.config.get('response_cache', {})
+        self.response_cache = ResponseCache(
+            enabled=response_cache_config.get('enabled', False),
+            similarity_threshold=response_cache_config.get('similarity_threshold', 0.95),
+            max_size=response_cache_config.get('max_size', 512),
+            ttl=response_cache_config.get('ttl_seconds', 3600)
+        )
+        scheduler_config = self.config.get('llm_scheduler', {})
+        self.scheduler = LLMScheduler(
+            max_concurrent=scheduler_config.get('max_concurrent', 2),
+            max_queue=scheduler_config.get('max_queue', 32),
+            max_queue_per_user=scheduler_config.get('max_queue_per_user', 2)
+        )
+        prompt_config = self.config.get('prompt', {})
+        self.prompt_builder = PromptBuilder(
+            max_tokens=prompt_config.get('max_tokens', 1536),
+            history_tokens=prompt_config.get('history_tokens', 512),
+            video_tokens=prompt_config.get('video_tokens', 512),
+            min_relative_score=prompt_config.get('min_relative_score', 0.5),
+            duplicate_overlap=prompt_config.get('duplicate_overlap', 0.8),
+            token_cache_size=prompt_config.get('token_cache_size', 4096),
+            safety_margin=prompt_config.get('safety_margin', 0.1)
+        )
+        summarizer_config = self.config.get('summarizer', {})
+        self.summarizer = MapReduceSummarizer(
+            lambda messages: self.prompt(chat_history=messages,stream=False)['message']['content'],
+            chunk_tokens=summarizer_config.get('chunk_tokens', 2000),
+            chunk_overlap=summarizer_config.get('chunk_overlap', 100),
+            parallelism=summarizer_config.get('parallelism', 2)
+        )
+
+        # Models are loaded on first use, warmup() loads them in parallel ahead of time
+        self.components = {
+            'whisper': self.audio_model.component,
+            'embeddings': LazyComponent('embeddings', self.load_embed_model),
+        }
+
+    def load_embed_model(self):
+        return load_embed_model(self.config.get('ingestion'))
+
+    def warmup(self):
+        """
+        Load every model in its own background thread, returns the threads
+        """
+        return [component.warm() for component in self.components.values()]
+
+    def ollama_status(self) -> dict:
+        """
+        Check the ollama service answers and the model is pulled
+        """
+        try:
+            response = ollama.Client(timeout=2).list()
+            names = [model.get('model') or model.get('name') or '' for model in response['models']]
+        except Exception as e:
+            return {'state': 'unavailable', 'error': str(e)}
+        if not any(name.split(':')[0] == self.model_name for name in names):
+            return {'state': 'missing_model', 'error': f"{self.model_name} is not pulled"}
+        return {'state': 'ready', 'error': None}
+
+    def status(self) -> dict:
+        """
+        Readiness of every component
+        """
+        status = {name: component.status() for name, component in self.components.items()}
+        status['ollama'] = self.ollama_status()
+        return status
+
+    def cache_stats(self) -> dict:
+        """
+        Sizes and hit rates of the caches
+        """
+        return {
+            **self.retrieval_cache.stats(), 'responses': self.response_cache.stats(),
+            'videos': self.video_cache.stats(), 'indexes': self.document_indexes.stats(), 'prompt': self.prompt_builder.stats(),
+            'transcription': self.transcriber.stats()
+        }
+
+    def collection_folder(self, user:str) -> str:
+        """
+        Data folder of the personal document collection of a user
+        """
+        # The hash keeps names that only differ by characters secure_filename drops apart
+        name = secure_filename(user) or 'user'
+        return os.path.join(self.collections_dir, f"{name}-{hashlib.sha1(user.encode()).hexdigest()[:8]}")
+
+    def get_document_index(self, data_folder) -> DocumentIndex:
+        """
+        Return the persisted index of a data folder, one index is kept per folder.
+        Shared folders stay open, user collections are opened on demand and closed when unused, see IndexRegistry
+        """
+        self.components['embeddings'].get()  # Indexes need the embedding model
+        vector_store = self.config.get('vector_store')
+        parse_workers = self.config.get('ingestion', {}).get('parse_workers', 1)
+        if os.path.dirname(os.path.abspath(data_folder)) == os.path.abspath(self.collections_dir):
+            persist_root = os.path.join(self.index_dir, 'collections', os.path.basename(data_folder))
+            return self.document_indexes.get(
+                data_folder, lambda: DocumentIndex(data_folder, persist_root, vector_store, parse_workers)
+            )
+        return self.document_indexes.get(
+            data_folder, lambda: DocumentIndex.for_folder(data_folder, self.index_dir, vector_store, parse_workers), pinned=True
+        )
+
+    def prompt(self,chat_history,stream,user=None,priority=BACKGROUND):
+        """
+        Call ollama once the scheduler gives a slot, a stream keeps its slot until it is consumed
+        """
+        if stream:
+            return self._stream_prompt(chat_history,user,priority)
+        with self.scheduler.submit(user, priority):
+            return ollama.chat(model=self.model_name,messages=chat_history,stream=False)
+
+    def _stream_prompt(self,chat_history,user,priority):
+        with self.scheduler.submit(user, priority):
+            yield from ollama.chat(model=self.model_name,messages=chat_history,stream=True)
 
 
     def get_youtube_video(self,url: str) -> str:
-        """Download a YouTube video, transcribe the audio, and summarize the transcription."""
-        # Download YouTube video
-        yt = YouTube(url)
-        video_title = yt.title  # Get the video title
-        video_stream = yt.streams.filter(only_audio=True).first()
-        output_file = video_stream.download(filename='video.mp4')
-        base, ext = os.path.splitext(output_file)
-        wav_file = base + '.wav'
-        os.system(f'ffmpeg -i {output_file} {wav_file}')
-
-        # Transcribe audio using Whisper
-        transcription = self.audio_model.get_transcript(wav_file)
-        os.remove('video.mp4')
-        os.remove('video.wav')
-        return video_title,transcription
-        
+        """Download a YouTube video and transcribe the audio."""
+        job = self.video_pipeline.transcribe(url)
+        return job['title'],job['transcription']
+
+    def process_video(self,url: str) -> dict:
+        """
+        Transcribe and summarize one video, videos already processed are served from the cache
+        Returns {"url", "title", "summary", "timings"}
+        """
+        start = time.time()
+        video_id = VideoCache.video_id(url)
+        cached = self.video_cache.get(video_id) if video_id else None
+        if cached:
+            return {'url': url, 'title': cached['title'], 'summary': cached['summary'], 'timings': {'cached': True, 'total': time.time() - start}}
+
+        job = self.video_pipeline.transcribe(url)
+        stage = time.time()
+        with span('youtube.summarize'):
+            summary,summary_stats = self.summarizer.summarize(job['transcription'])
+        job['timings']['summarize'] = time.time() - stage
+        job['timings'].update(summary_stats)
+        job['timings']['total'] = time.time() - start
+        if video_id:
+            self.video_cache.put(video_id,job['title'],job['transcription'],summary)
+        return {'url': url, 'title': job['title'], 'summary': summary, 'timings': job['timings']}
+
     def check_for_videos(self,text):
         youtube_url_pattern = re.compile(r'(https?://(?:www\.)?(?:youtube\.com/watch\?v=|youtu\.be/)[\w\-]+)')
-        matches = youtube_url_pattern.findall(text)
+        matches = list(dict.fromkeys(youtube_url_pattern.findall(text)))  # Drop repeated links, keep order
         if not matches:
             return 1,""
         
+        # Every video is processed in parallel, the message takes as long as the slowest video
+        try:
+            start = time.time()
+            videos = self.video_pipeline.map(self.process_video, matches)
+        except:
+            return 2,"Tell the user exactly 'Youtube feature is not working for tecnical issues and I cannot assist you with it, thanks for your patience'"
+        annotate(videos=[video['timings'] for video in videos], videos_seconds=round(time.time() - start, 3))
+
         context = ""
-        template = """
-        Summarize the following video, be as concise as possible unless the user ask, extract some bullet points, you should answer with summary exclusively
-        Transcription: {transcription}
-        """
-        for idx,match in enumerate(matches):
-            try:
-                video_title,transcription = self.get_youtube_video(match)
-                prompt = [
-                {'role': 'user', 'content': template.format(transcription=transcription)}
-            ]
-                summary = self.prompt(chat_history=prompt,stream=False)['message']['content']
-                context+=f"Transcription of the Video #{idx}\nTitle of the video:{video_title}\nUrl of the video: {match}\nSummary of the video:\n{summary}\n\n"
-            except:
-                return 2,"Tell the user exactly 'Youtube feature is not working for tecnical issues and I cannot assist you with it, thanks for your patience'"
+        for idx,video in enumerate(videos):
+            context+=f"Transcription of the Video #{idx}\nTitle of the video:{video['title']}\nUrl of the video: {video['url']}\nSummary of the video:\n{video['summary']}\n\n"
         return 0,context
 
-    def chat(self,chat_history, data_folder, is_stream=True):
+    def prepare_chat(self,chat_history, data_folder):
         """
-        System role message must always be the first
+        Blocking part of a chat turn: load the index and run the video tools
+        Returns (document_index, history, prompt), history is the conversation before the current prompt
         """
-        documents = SimpleDirectoryReader(data_folder).load_data()
-
-        # Limit metadata to current folder
-        cwd = os.getcwd()
-        for doc in documents:
-            fp = doc.metadata['file_path']
-            doc.metadata['file_path'] = os.path.relpath(fp, cwd)
-        # Load documents
-        index = VectorStoreIndex.from_documents(
-            documents,
-        )
+        # Load persisted index, it is only built the first time the folder is used
+        document_index = self.get_document_index(data_folder)
+        document_index.get_index()
 
-        # Load chat_history or create new history 
-        if len(chat_history)==1:
-            memory = ChatMemoryBuffer.from_defaults(token_limit=1500)
-        else:
-            # Save all messages into memory except the last messag that is the current prompt
-            memory = ChatMemoryBuffer.from_defaults(token_limit=1500)
-            for message in chat_history[:-1]:
-                memory.put(ChatMessage(role=message['role'],content=message['content']))
-        
+        # Every message but the last one that is the current prompt, build_messages keeps what fits
+        history = chat_history[:-1]
 
-        
         # Current user input
         user_input = chat_history[-1]['content']
 
@@ -107,50 +332,102 @@ class SLM:
         if yt_ft == 1:
             prompt = user_input
         elif yt_ft == 0:
+            context = self.prompt_builder.truncate(context, self.prompt_builder.video_tokens)
             template = """Context:\n{context}\n|---------------------------------|\nUser input: \n{user_input}"""
             prompt = template.format(context=context,user_input=user_input)
         else:
-            memory = ChatMemoryBuffer.from_defaults(token_limit=1500)
+            history = []
             prompt = """Write a message for user stating at the current moment is not possible to retrieve the youtube video from the web, Just answer with the message and nothing else.\nMessage:"""
-        
+        return document_index, history, prompt
 
-        # Create chat engine with memory
-        chat_engine = index.as_chat_engine(
-            chat_mode = "context",
-            memory = memory,
-            system_prompt = (
-                "You are my helpful assitant"
-            )
+    def build_messages(self, prepared):
+        """
+        Retrieve the chunks of a prepared turn and assemble the messages within the prompt token budget
+        """
+        document_index, history, prompt = prepared
+        nodes = self.retrieval_cache.retrieve(document_index, prompt)
+        # Hybrid scores are fused ranks, not similarities
+        messages, stats = self.prompt_builder.build(
+            SYSTEM_PROMPT, history, prompt, nodes, similarity_scores=self.retrieval_cache.mode != 'hybrid'
         )
+        annotate(prompt_tokens=stats)
+        return messages
 
+    def _response_cache_key(self, chat_history, prepared):
+        """
+        (index version, query embedding) of a cacheable turn, None otherwise.
+        Only first turns without video context are cached, their answer depends on the documents alone.
+        """
+        document_index, history, prompt = prepared
+        if not self.response_cache.enabled or len(chat_history) != 1 or prompt != chat_history[-1]['content']:
+            return None
+        version = (document_index.persist_dir, document_index.generation)
+        return version, self.retrieval_cache.get_query_embedding(prompt)
 
-        print(prompt)
+    def cached_answer(self, chat_history, prepared):
+        """
+        Cached answer of a similar first question, {"answer", "source_nodes", "similarity"} or None
+        """
+        key = self._response_cache_key(chat_history, prepared)
+        if key is None:
+            return None
+        return self.response_cache.lookup(*key)
+
+    def remember_answer(self, chat_history, prepared, answer:str):
+        """
+        Cache the answer of a first question with the nodes it was based on
+        """
+        key = self._response_cache_key(chat_history, prepared)
+        if key is None or not answer:
+            return
+        document_index, history, prompt = prepared
+        source_nodes = self.retrieval_cache.retrieve(document_index, prompt)  # Served by the retrieval cache
+        self.response_cache.put(*key, answer, source_nodes)
+
+    def chat(self,chat_history, data_folder, is_stream=True, prepared=None):
+        """
+        System role message must always be the first
+        prepared is the result of prepare_chat when the caller already ran it.
+        The caller holds an INTERACTIVE scheduler ticket until the stream is consumed.
+        Returns a generator of the chunks of the answer, or the whole answer when is_stream is False.
+        """
+        messages = self.build_messages(prepared or self.prepare_chat(chat_history, data_folder))
         if is_stream:
-            response = chat_engine.stream_chat(prompt)
-        else:
-            reponse = chat_engine.chat(prompt)
-        print("Send object streaming")
+            return self._stream_chat(messages)
+        timer = GenerationTimer()
+        response = ollama.chat(model=self.model_name,messages=messages,stream=False)
+        timer.chunk(response)
+        return response['message']['content']
+
+    def _stream_chat(self,messages):
+        timer = GenerationTimer()
+        for part in ollama.chat(model=self.model_name,messages=messages,stream=True):
+            timer.chunk(part)
+            yield part['message']['content']
+
+    async def achat(self,chat_history, data_folder, prepared=None):
+        """
+        Async version of chat, yields the chunks of the answer.
+        Closing the generator closes the request to ollama, which stops the generation.
+        """
+        # Index loading, video tools and the query embedding block, keep them off the event loop
+        messages = await asyncio.to_thread(lambda: self.build_messages(prepared or self.prepare_chat(chat_history, data_folder)))
 
-        return response
+        timer = GenerationTimer()
+        stream = await ollama.AsyncClient().chat(model=self.model_name,messages=messages,stream=True)
+        try:
+            async for part in stream:
+                timer.chunk(part)
+                yield part['message']['content']
+        finally:
+            await stream.aclose()
     
-    def create_title(self,message) ->str:
+    def create_title(self,message,user=None) ->str:
         template="""
         Your only task is to create headline for the following text, the complete Output of the text should be less than 30 characters
         Text:{context}\n\n
         Headline: 
         """
         prompt =[{'role': 'user', 'content': template.format(context=message)}]
-        title = self.prompt(chat_history=prompt,stream=False)
+        title = self.prompt(chat_history=prompt,stream=False,user=user,priority=BACKGROUND)
         return title['message']['content'][:45]
-    
-    @staticmethod
-    def get_source_file_paths(response):
-        source_nodes = response.source_nodes
-        file_paths = set()
-        for node in source_nodes:
-            if 'file_path' in node.metadata:
-                file_paths.add(node.metadata['file_path'])
-        return list(file_paths)
-    
-
-        
\ No newline at end of file
@@ -1,4 +1,7 @@
 from .db import db
 from .SLM import *
+from .document_index import *
 from .helper_functions import *
-from .session import *
\ No newline at end of file
+from .session import *
+from .llm_scheduler import *
+from .response_cache import *
\ No newline at end of file
@@ -0,0 +1,101 @@
+import re
+import threading
+import subprocess
+import numpy as np
+
+SAMPLING_RATE = 16000  # Sampling rate expected by Whisper
+
+def _ffmpeg_command(input_arg:str):
+    return [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', input_arg,
+        '-ac', '1', '-ar', str(SAMPLING_RATE), '-f', 'f32le', 'pipe:1'
+    ]
+
+def _feed(proc, source):
+    """
+    Write bytes or a file-like object to the stdin of ffmpeg
+    """
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            proc.stdin.write(source)
+        else:
+            for block in iter(lambda: source.read(1 << 16), b''):
+                proc.stdin.write(block)
+    except (BrokenPipeError, ValueError):
+        pass  # ffmpeg stopped reading, the error is reported by its exit code
+    finally:
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+def _start_ffmpeg(source):
+    """
+    Start ffmpeg decoding a file path, bytes or a file-like object to raw float32 samples on stdout
+    """
+    if isinstance(source, str):
+        proc = subprocess.Popen(_ffmpeg_command(source), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    else:
+        proc = subprocess.Popen(_ffmpeg_command('pipe:0'), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        threading.Thread(target=_feed, args=(proc, source), daemon=True).start()
+    return proc
+
+def _check_exit(proc, decoded_any:bool):
+    proc.wait()
+    if proc.returncode != 0 and not decoded_any:
+        raise RuntimeError(f"ffmpeg could not decode the audio: {proc.stderr.read().decode(errors='ignore').strip()}")
+
+def decode_audio(source) -> np.ndarray:
+    """
+    Decode a file path, bytes or a file-like object to a mono float32 buffer, no temporary files are written
+    """
+    proc = _start_ffmpeg(source)
+    try:
+        data = proc.stdout.read()
+        _check_exit(proc, len(data) > 0)
+    finally:
+        proc.kill()
+    return np.frombuffer(data, dtype=np.float32)
+
+def iter_audio_windows(source, window_seconds:float = 30, overlap_seconds:float = 2):
+    """
+    Stream overlapping windows of decoded audio, only one window is kept in memory at a time
+    """
+    window_samples = int(window_seconds * SAMPLING_RATE)
+    overlap_samples = int(overlap_seconds * SAMPLING_RATE)
+    proc = _start_ffmpeg(source)
+    decoded_any = False
+    try:
+        carry = np.zeros(0, dtype=np.float32)
+        while True:
+            needed = window_samples - len(carry)
+            data = proc.stdout.read(needed * 4)  # Blocks until the window is full or the audio ends
+            samples = np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+            if len(samples) == 0 and decoded_any:
+                break  # The carried overlap was already part of the previous window
+            window = np.concatenate([carry, samples])
+            if len(window) == 0:
+                break
+            decoded_any = True
+            yield window
+            if len(samples) < needed:
+                break
+            carry = window[-overlap_samples:] if overlap_samples else np.zeros(0, dtype=np.float32)
+        _check_exit(proc, decoded_any)
+    finally:
+        proc.kill()
+
+def _normalize(word:str) -> str:
+    return re.sub(r'[^\w]', '', word.lower())
+
+def merge_overlap(previous_words, text:str, max_overlap_words:int = 30) -> str:
+    """
+    Drop the beginning of text that repeats the end of the previous window
+    """
+    words = text.split()
+    tail = [_normalize(w) for w in previous_words[-max_overlap_words:]]
+    head = [_normalize(w) for w in words[:max_overlap_words]]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size]:
+            return " ".join(words[size:])
+    return " ".join(words)
@@ -0,0 +1,105 @@
+import os
+import re
+import json
+from collections import Counter
+from typing import List, Tuple
+import numpy as np
+
+BM25_FILE = 'bm25.json'
+BM25_ARRAYS_FILE = 'bm25.npz'
+
+# Words, numbers and codes like "AB-1234", "E_404" or "v1.2.3" are kept as one term
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[\-_.][a-z0-9]+)*')
+
+def tokenize(text:str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    def __init__(self, node_ids, terms, offsets, postings, frequencies, lengths, k1:float = 1.2, b:float = 0.75):
+        """
+        Compact BM25 inverted index over the chunks of a document index.
+        Postings are stored in CSR layout: the chunks containing term t are postings[offsets[t]:offsets[t + 1]]
+        with their term frequencies in frequencies, so the index is a few flat NumPy arrays.
+        """
+        self.node_ids = node_ids
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1 + (len(node_ids) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def from_nodes(cls, nodes, k1:float = 1.2, b:float = 0.75) -> "BM25Index":
+        """
+        Build the index from llama_index nodes, keyed by node id
+        """
+        node_ids, counts = [], []
+        for node in nodes:
+            node_ids.append(node.node_id)
+            counts.append(Counter(tokenize(node.get_content())))
+
+        terms = sorted({term for count in counts for term in count})
+        term_ids = {term: i for i, term in enumerate(terms)}
+        by_term = [[] for _ in terms]
+        for row, count in enumerate(counts):
+            for term, frequency in count.items():
+                by_term[term_ids[term]].append((row, frequency))
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings) for postings in by_term])
+        postings = np.fromiter((row for postings in by_term for row, _ in postings), dtype=np.int32, count=offsets[-1])
+        frequencies = np.fromiter((f for postings in by_term for _, f in postings), dtype=np.float32, count=offsets[-1])
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float32)
+        return cls(node_ids, terms, offsets, postings, frequencies, lengths, k1, b)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def search(self, query:str, top_k:int) -> List[Tuple[str, float]]:
+        """
+        Best top_k (node_id, score) for the query, chunks without any query term are left out
+        """
+        term_ids = [self.terms[term] for term in set(tokenize(query)) if term in self.terms]
+        if not term_ids or not self.node_ids:
+            return []
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.postings[start:end]
+            frequency = self.frequencies[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[rows] / self.avg_length)
+            scores[rows] += self.idf[term_id] * frequency * (self.k1 + 1) / (frequency + norm)
+
+        matched = np.flatnonzero(scores)
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.node_ids[i], float(scores[i])) for i in top]
+
+    def save(self, persist_dir:str):
+        with open(os.path.join(persist_dir, BM25_FILE), 'w') as f:
+            terms = sorted(self.terms, key=self.terms.get)
+            json.dump({'node_ids': self.node_ids, 'terms': terms, 'k1': self.k1, 'b': self.b}, f)
+        np.savez(
+            os.path.join(persist_dir, BM25_ARRAYS_FILE),
+            offsets=self.offsets, postings=self.postings, frequencies=self.frequencies, lengths=self.lengths
+        )
+
+    @staticmethod
+    def exists(persist_dir:str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, BM25_FILE))
+
+    @classmethod
+    def load(cls, persist_dir:str) -> "BM25Index":
+        with open(os.path.join(persist_dir, BM25_FILE), 'r') as f:
+            data = json.load(f)
+        with np.load(os.path.join(persist_dir, BM25_ARRAYS_FILE)) as arrays:
+            return cls(
+                data['node_ids'], data['terms'], arrays['offsets'], arrays['postings'],
+                arrays['frequencies'], arrays['lengths'], data['k1'], data['b']
+            )
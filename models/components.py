@@ -0,0 +1,54 @@
+import time
+import threading
+from .metrics import log
+
+class LazyComponent:
+    def __init__(self, name:str, loader):
+        """
+        Model or resource loaded on first use, or ahead of time in a background thread with warm().
+        Concurrent callers wait for the same load, the state is reported by status().
+        """
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._lock = threading.Lock()
+        self.state = 'pending'
+        self.error = None
+        self.load_seconds = None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self.state = 'loading'
+                    start = time.time()
+                    try:
+                        self._value = self._loader()
+                    except Exception as e:
+                        self.state = 'error'
+                        self.error = str(e)
+                        raise
+                    self.load_seconds = round(time.time() - start, 3)
+                    self.state = 'ready'
+                    self.error = None
+        return self._value
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    def warm(self) -> threading.Thread:
+        """
+        Start loading in a background thread, errors are kept in status() and retried on the next get()
+        """
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                log('component_load_failed', component=self.name, error=str(e))
+        thread = threading.Thread(target=load, name=f"warm-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        return {'state': self.state, 'load_seconds': self.load_seconds, 'error': self.error}
@@ -1,27 +1,143 @@
 import mysql.connector
+import queue
+import threading
+import time
 from contextlib import contextmanager
+from .metrics import span
 
 class db:
     def __init__(self, config):
+        """
+        Database access through a bounded pool of connections
+        Config:
+            - Connection arguments for mysql.connector.connect
+            - Optional "pool" section: size, timeout, recycle_seconds, health_check_interval
+        """
+        config = dict(config)
+        pool_config = config.pop('pool', {})
         self.config = config
-    
+        self.pool_size = pool_config.get('size', 5)
+        self.pool_timeout = pool_config.get('timeout', 10)                            # Seconds to wait for a free connection
+        self.recycle_seconds = pool_config.get('recycle_seconds', 3600)               # Close connections older than this
+        self.health_check_interval = pool_config.get('health_check_interval', 30)     # Ping connections idle longer than this
+
+        self._idle = queue.LifoQueue()  # Reuse the most recent connection, the others can age out
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'in_use': 0,
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'reconnected': 0,
+            'discarded': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def stats(self):
+        """
+        Pool usage and wait counters
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['size'] = self.pool_size
+        stats['idle'] = self._idle.qsize()
+        return stats
+
+    def _checkout(self):
+        """
+        Take an idle connection, checking it is still usable, or open a new one
+        Returns (connection, created_at)
+        """
+        while True:
+            try:
+                conn, created_at, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                conn = mysql.connector.connect(**self.config)
+                self._count('created')
+                return conn, time.monotonic()
+
+            now = time.monotonic()
+            if now - created_at > self.recycle_seconds:
+                self._close(conn)
+                self._count('recycled')
+                continue
+            if now - last_used > self.health_check_interval:
+                connection_id = conn.connection_id
+                try:
+                    # Reconnects in place when the server closed the connection
+                    conn.ping(reconnect=True, attempts=1, delay=0)
+                except mysql.connector.Error:
+                    self._close(conn)
+                    self._count('discarded')
+                    continue
+                if conn.connection_id != connection_id:
+                    self._count('reconnected')
+                    created_at = time.monotonic()
+            self._count('reused')
+            return conn, created_at
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
     @contextmanager
     def get_connection(self):
-        conn = mysql.connector.connect(**self.config)
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            self._count('timeouts')
+            raise RuntimeError("Timed out waiting for a database connection")
+        waited = time.monotonic() - start
+        with self._stats_lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        conn = None
         try:
+            conn, created_at = self._checkout()
             yield conn
+        except Exception:
+            # The connection state is unknown after an error, never give it back to the pool
+            if conn is not None:
+                self._close(conn)
+                self._count('discarded')
+            raise
+        else:
+            self._idle.put((conn, created_at, time.monotonic()))
         finally:
-            conn.close()
+            self._count('in_use', -1)
+            self._slots.release()
 
     def execute_query(self, query, params=None):
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query, params or ())
+                # Rows must be read before the commit, mysql.connector refuses to commit with an unread result
+                rows = cursor.fetchall() if cursor.with_rows else []
                 conn.commit()
-                return cursor.fetchall()
+                return rows
 
-    def call_proc(self, proc_name, params):
+    def ping(self):
+        """
+        Check the server answers with a pooled connection, raises if it does not
+        """
         with self.get_connection() as conn:
+            conn.ping(reconnect=False)
+
+    def call_proc(self, proc_name, params):
+        with span(f"db.{proc_name}"), self.get_connection() as conn:
             with conn.cursor() as cursor:
                 new_params = cursor.callproc(proc_name, params)
                 conn.commit()
@@ -29,4 +145,4 @@ class db:
                 results = []
                 for result in cursor.stored_results():
                     results.append(result.fetchall())
-                return new_params, results  # Return parameters (which include outputs), and any result sets
\ No newline at end of file
+                return new_params, results  # Return parameters (which include outputs), and any result sets
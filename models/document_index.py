@@ -0,0 +1,407 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from llama_index.core import VectorStoreIndex, StorageContext, Settings, load_index_from_storage
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from .vector_store import MmapVectorStore
+from .bm25 import BM25Index
+from .metrics import span, log
+from document_parser import parse_file
+
+# Bump whenever the way documents are parsed or stored changes, so old indexes are not reused
+INDEX_FORMAT_VERSION = 2
+
+MANIFEST_FILE = 'manifest.json'
+VECTOR_STORE_FILE = 'default__vector_store.json'  # Where StorageContext.persist writes the default vector store
+
+def directory_size(path:str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Replaced by a concurrent refresh
+    return total
+
+class DocumentIndex:
+    def __init__(self, data_folder:str, persist_root:str = 'storage/index', vector_store:dict = None, parse_workers:int = 1):
+        """
+        Vector index over the documents of a data folder, persisted on disk.
+        The index is stored under a versioned directory and loaded once, on first use.
+        A manifest of per-file hashes lets refresh() embed only new or modified files.
+        vector_store: {"type": "simple" (llama_index default) or "mmap", "quantize": int8 vectors for mmap}
+        parse_workers: processes parsing files in parallel when several files changed
+        """
+        self.data_folder = data_folder
+        self.persist_root = persist_root
+        self.vector_store = vector_store or {'type': 'simple'}
+        self.parse_workers = parse_workers
+        self.generation = 0
+        self.size = None  # Bytes of the persisted index, measured on load and persist
+        self._index = None
+        self._bm25 = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_folder(cls, data_folder:str, index_dir:str = 'storage/index', vector_store:dict = None, parse_workers:int = 1):
+        """
+        Create the index of a data folder, each folder gets its own directory under index_dir
+        """
+        persist_root = os.path.join(index_dir, os.path.basename(os.path.normpath(data_folder)))
+        return cls(data_folder, persist_root, vector_store, parse_workers)
+
+    @property
+    def persist_dir(self) -> str:
+        """
+        Directory for the current index version, it changes with the format, the embedding model and the vector store
+        """
+        embed_model = getattr(Settings.embed_model, 'model_name', 'default')
+        embed_slug = re.sub(r'[^\w\-]+', '-', embed_model).strip('-')
+        store_slug = ''
+        if self.vector_store['type'] == 'mmap':
+            store_slug = '-mmap-int8' if self.vector_store.get('quantize') else '-mmap'
+        return os.path.join(self.persist_root, f"v{INDEX_FORMAT_VERSION}-{embed_slug}{store_slug}")
+
+    def storage_context(self, persist_dir:str = None) -> StorageContext:
+        """
+        Storage for a new index, or for the index persisted in persist_dir
+        """
+        if self.vector_store['type'] != 'mmap':
+            return StorageContext.from_defaults(persist_dir=persist_dir)
+        if persist_dir is None:
+            return StorageContext.from_defaults(vector_store=MmapVectorStore(quantize=self.vector_store.get('quantize', False)))
+        vector_store = MmapVectorStore.from_persist_path(os.path.join(persist_dir, VECTOR_STORE_FILE))
+        return StorageContext.from_defaults(persist_dir=persist_dir, vector_store=vector_store)
+
+    def new_index(self) -> VectorStoreIndex:
+        return VectorStoreIndex([], storage_context=self.storage_context())
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Inter-process lock so the CLI and the app never write the same index at once
+        """
+        os.makedirs(self.persist_root, exist_ok=True)
+        with open(os.path.join(self.persist_root, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_index(self) -> VectorStoreIndex:
+        """
+        Return the loaded index, loading it from disk or building it if it does not exist yet
+        """
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    if self.exists():
+                        with self._file_lock():
+                            self._use(*self.load())
+                    else:
+                        self.refresh()
+        return self._index
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.persist_dir, MANIFEST_FILE))
+
+    @span('index.load')
+    def load(self):
+        """
+        Load a persisted index, its BM25 index and its generation from disk
+        """
+        index = load_index_from_storage(self.storage_context(self.persist_dir))
+        if BM25Index.exists(self.persist_dir):
+            bm25 = BM25Index.load(self.persist_dir)
+        else:
+            bm25 = self.build_bm25(index)  # Persisted before BM25 was added
+        self.size = directory_size(self.persist_dir)
+        return index, bm25, self.read_manifest()['generation']
+
+    def disk_size(self) -> int:
+        """
+        Bytes of the persisted index, measured once if it was not loaded or persisted yet
+        """
+        if self.size is None:
+            self.size = directory_size(self.persist_dir)
+        return self.size
+
+    def _use(self, index, bm25, generation):
+        """
+        Make an index live, the generation is bumped last so caches keyed by it never see a stale index
+        """
+        self._bm25 = bm25
+        self._index = index
+        self.generation = generation
+
+    @staticmethod
+    def build_bm25(index:VectorStoreIndex) -> BM25Index:
+        return BM25Index.from_nodes(index.docstore.docs.values())
+
+    def search(self, query:str, embedding, top_k:int = 2, mode:str = 'dense', candidates:int = 10, rrf_k:int = 60):
+        """
+        Retrieve the top_k chunks for a query, returns (nodes, timings)
+        Modes:
+            - dense: vector similarity only
+            - hybrid: dense and BM25 rankings of `candidates` chunks each, fused by reciprocal rank
+            - prefilter: vector similarity among the BM25 candidates, dense only when no chunk has a query term
+        """
+        index = self.get_index()
+        bm25 = self._bm25
+        timings = {}
+
+        def dense(node_ids=None):
+            start = time.perf_counter()
+            size = top_k if mode != 'hybrid' else candidates
+            nodes = index.as_retriever(similarity_top_k=size, node_ids=node_ids).retrieve(QueryBundle(query_str=query, embedding=embedding))
+            timings['dense_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            return nodes
+
+        if mode == 'dense' or bm25 is None:
+            return dense(), timings
+
+        start = time.perf_counter()
+        lexical = bm25.search(query, candidates)
+        timings['bm25_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        timings['bm25_hits'] = len(lexical)
+
+        if mode == 'prefilter':
+            return dense([node_id for node_id, _ in lexical] or None), timings
+
+        # Reciprocal rank fusion, chunks ranked high by either side come first
+        dense_nodes = dense()
+        scores, nodes = {}, {}
+        for rank, node in enumerate(dense_nodes):
+            scores[node.node.node_id] = scores.get(node.node.node_id, 0) + 1 / (rrf_k + rank + 1)
+            nodes[node.node.node_id] = node.node
+        for rank, (node_id, _) in enumerate(lexical):
+            if node_id not in nodes:
+                node = index.docstore.get_node(node_id, raise_error=False)
+                if node is None:
+                    continue  # The index was swapped since the BM25 search
+                nodes[node_id] = node
+            scores[node_id] = scores.get(node_id, 0) + 1 / (rrf_k + rank + 1)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        timings['from_dense'] = len([n for n in ranked if n in {node.node.node_id for node in dense_nodes}])
+        timings['from_bm25'] = len([n for n in ranked if n in {node_id for node_id, _ in lexical}])
+        return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked], timings
+
+    def read_manifest(self) -> dict:
+        """
+        Manifest layout: {"generation": int, "files": {relative_path: {"sha256", "mtime_ns", "size", "doc_ids"}}}
+        """
+        manifest_path = os.path.join(self.persist_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return {'generation': 0, 'files': {}}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def list_files(self):
+        """
+        Files of the data folder with the same rules as SimpleDirectoryReader, hidden files are skipped
+        """
+        if not os.path.isdir(self.data_folder):
+            return []
+        return sorted(
+            f for f in os.listdir(self.data_folder)
+            if not f.startswith('.') and os.path.isfile(os.path.join(self.data_folder, f))
+        )
+
+    @staticmethod
+    def hash_file(file_path:str) -> str:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def scan(self, manifest:dict):
+        """
+        Compare the data folder against the manifest
+        Returns:
+            - Files to embed (new or modified), with their stat and hash
+            - Files to remove from the index (modified or deleted)
+            - Files whose content did not change but their mtime did
+        """
+        to_add, to_remove, touched = {}, [], {}
+        current = self.list_files()
+        for name in current:
+            file_path = os.path.join(self.data_folder, name)
+            stat = os.stat(file_path)
+            entry = manifest['files'].get(name)
+            # Cheap check first, only hash when size or mtime changed
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            sha256 = self.hash_file(file_path)
+            info = {'sha256': sha256, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            if entry and entry['sha256'] == sha256:
+                touched[name] = info
+            else:
+                if entry:
+                    to_remove.append(name)
+                to_add[name] = info
+
+        for name in manifest['files']:
+            if name not in current:
+                to_remove.append(name)
+        return to_add, to_remove, touched
+
+    def load_file_documents(self, name:str):
+        """
+        Parse one file into documents with stable ids so they can be deleted later
+        """
+        return parse_file(self.data_folder, name, os.getcwd())
+
+    def parse_files(self, names):
+        """
+        Parse files in parallel worker processes, yields (name, documents or the parsing exception)
+        Worker processes are spawned, forking the multi-threaded app could deadlock them.
+        They only import document_parser, the app itself is not loaded again in them
+        """
+        if self.parse_workers <= 1 or len(names) <= 1:
+            for name in names:
+                try:
+                    yield name, self.load_file_documents(name)
+                except Exception as e:
+                    yield name, e
+            return
+
+        workers = min(self.parse_workers, len(names))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [(name, executor.submit(parse_file, self.data_folder, name, os.getcwd())) for name in names]
+            for name, future in futures:
+                try:
+                    yield name, future.result()
+                except Exception as e:
+                    yield name, e
+
+    @span('index.refresh')
+    def refresh(self) -> dict:
+        """
+        Bring the persisted index up to date with the data folder.
+        Only new or modified files are chunked and embedded, chunks of deleted files are removed.
+        Changes are applied to a working copy that replaces the live index once persisted.
+        """
+        start = time.time()
+        with self._lock, self._file_lock():
+            manifest = self.read_manifest()
+            to_add, to_remove, touched = self.scan(manifest)
+            stats = {
+                'added': len([n for n in to_add if n not in manifest['files']]),
+                'modified': len([n for n in to_add if n in manifest['files']]),
+                'deleted': len([n for n in to_remove if n not in to_add]),
+                'unchanged': len(manifest['files']) - len(to_remove),
+            }
+
+            if not to_add and not to_remove:
+                if touched:
+                    manifest['files'].update({n: {**manifest['files'][n], **info} for n, info in touched.items()})
+                    self.write_manifest(self.persist_dir, manifest)
+                # Another process may have updated the index on disk
+                if self._index is None or manifest['generation'] != self.generation:
+                    if self.exists():
+                        self._use(*self.load())
+                    else:
+                        index = self.new_index()
+                        self._use(index, self.build_bm25(index), 0)
+                stats['seconds'] = round(time.time() - start, 3)
+                return stats
+
+            index = load_index_from_storage(self.storage_context(self.persist_dir)) if self.exists() else self.new_index()
+            for name in to_remove:
+                for doc_id in manifest['files'].pop(name)['doc_ids']:
+                    index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+            stage = time.time()
+            documents = []
+            for name, file_documents in self.parse_files(list(to_add)):
+                if isinstance(file_documents, Exception):
+                    log('index_file_skipped', data_folder=self.data_folder, file=name, error=str(file_documents))
+                    continue
+                documents.extend(file_documents)
+                manifest['files'][name] = {**to_add[name], 'doc_ids': [doc.id_ for doc in file_documents]}
+            stats['documents'] = len(documents)
+            stats['parse_seconds'] = round(time.time() - stage, 3)
+
+            # Chunk all new documents together so embeddings are computed in batches
+            stage = time.time()
+            nodes = run_transformations(documents, Settings.transformations)
+            index.insert_nodes(nodes)
+            stats['embed_seconds'] = round(time.time() - stage, 3)
+            for doc in documents:
+                index.docstore.set_document_hash(doc.id_, doc.hash)
+
+            for name, info in touched.items():
+                manifest['files'][name].update(info)
+            manifest['generation'] += 1
+            stage = time.time()
+            bm25 = self.build_bm25(index)
+            stats['bm25_seconds'] = round(time.time() - stage, 3)
+            self.persist(index, manifest, bm25)
+
+            self._use(index, bm25, manifest['generation'])
+            stats['chunks'] = len(nodes)
+            stats['seconds'] = round(time.time() - start, 3)
+            return stats
+
+    @staticmethod
+    def write_manifest(persist_dir:str, manifest:dict):
+        """
+        Write to a temporary file and rename it, readers in other processes never see a half written manifest
+        """
+        path = os.path.join(persist_dir, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(path + '.tmp', path)
+
+    def persist(self, index:VectorStoreIndex, manifest:dict, bm25:BM25Index):
+        """
+        Write index, BM25 index and manifest to a temporary folder first so a crash never leaves a half written index
+        """
+        tmp_dir = self.persist_dir + '.tmp'
+        old_dir = self.persist_dir + '.old'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        index.storage_context.persist(persist_dir=tmp_dir)
+        bm25.save(tmp_dir)
+        self.write_manifest(tmp_dir, manifest)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.persist_dir):
+            os.replace(self.persist_dir, old_dir)
+        os.replace(tmp_dir, self.persist_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self.size = directory_size(self.persist_dir)
+
+
+class IndexWatcher(threading.Thread):
+    def __init__(self, document_index:DocumentIndex, interval:float = 30):
+        """
+        Background thread that keeps a document index in sync with its data folder
+        """
+        super().__init__(name='index-watcher', daemon=True)
+        self.document_index = document_index
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                stats = self.document_index.refresh()
+                if stats['added'] or stats['modified'] or stats['deleted']:
+                    log('index_refreshed', data_folder=self.document_index.data_folder, **stats)
+            except Exception as e:
+                log('index_refresh_failed', data_folder=self.document_index.data_folder, error=str(e))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
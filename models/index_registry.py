@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+class IndexRegistry:
+    def __init__(self, max_open:int = 16, max_open_bytes:int = 512 * 1024 * 1024):
+        """
+        Open document indexes by data folder.
+        Collections are kept in an LRU: once more than max_open are open, or their persisted size
+        goes over max_open_bytes, the least recently used are closed and loaded again on the next use.
+        Pinned indexes (the shared data folder) are never closed and do not count against the limits.
+        Sizes are the ones DocumentIndex measures on load and persist, the lock never waits on the disk.
+        """
+        self.max_open = max_open
+        self.max_open_bytes = max_open_bytes
+        self._pinned = {}
+        self._open = OrderedDict()  # data_folder -> DocumentIndex
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'closed': 0, 'hits': 0}
+
+    def _lookup(self, data_folder:str):
+        if data_folder in self._pinned:
+            return self._pinned[data_folder]
+        if data_folder in self._open:
+            self._open.move_to_end(data_folder)
+            return self._open[data_folder]
+        return None
+
+    def get(self, data_folder:str, factory, pinned:bool = False):
+        """
+        Return the open index of a folder, factory() creates it on a miss
+        """
+        with self._lock:
+            document_index = self._lookup(data_folder)
+            if document_index is not None:
+                self._stats['hits'] += 1
+                return document_index
+
+        # Measure an index already on disk outside the lock, it is not loaded until first used
+        document_index = factory()
+        document_index.disk_size()
+
+        with self._lock:
+            existing = self._lookup(data_folder)
+            if existing is not None:
+                return existing  # Opened by another request meanwhile
+            self._stats['opened'] += 1
+            if pinned:
+                self._pinned[data_folder] = document_index
+            else:
+                self._open[data_folder] = document_index
+                self._evict()
+            return document_index
+
+    def _evict(self):
+        """
+        Close least recently used collections past the limits, the newest one always stays open
+        """
+        size = sum(document_index.disk_size() for document_index in self._open.values())
+        while len(self._open) > 1 and (len(self._open) > self.max_open or size > self.max_open_bytes):
+            # Requests still using it keep their reference, memory is freed once they finish
+            _, document_index = self._open.popitem(last=False)
+            size -= document_index.disk_size()
+            self._stats['closed'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = len(self._open)
+            stats['pinned'] = len(self._pinned)
+            stats['open_bytes'] = sum(document_index.disk_size() for document_index in self._open.values())
+        return stats
@@ -0,0 +1,221 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+
+# Priorities, lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class QueueFull(Exception):
+    def __init__(self, message, status=503):
+        """
+        Raised instead of queueing, status is the HTTP code to answer with:
+        429 when the user has too many queued requests, 503 when the whole queue is full
+        """
+        super().__init__(message)
+        self.status = status
+
+class Ticket:
+    def __init__(self, scheduler, user, priority):
+        """
+        Place of one LLM call in the scheduler queue.
+        `admitted` resolves once the call may run, release() must always be called afterwards.
+        """
+        self.scheduler = scheduler
+        self.user = user
+        self.priority = priority
+        self.state = 'queued'  # (reserved ->) queued -> running -> done
+        self.admitted = Future()
+        self.enqueued_at = time.monotonic()
+
+    def position(self) -> int:
+        """
+        1 for the next call to run, 0 once admitted
+        """
+        return self.scheduler.position(self)
+
+    def wait(self, timeout:float = None) -> bool:
+        """
+        Block until admitted, returns False if the timeout expired first
+        """
+        done, _ = wait([self.admitted], timeout=timeout)
+        return bool(done)
+
+    def enqueue(self):
+        """
+        Turn a reservation into a queued call
+        """
+        self.scheduler.enqueue(self)
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class LLMScheduler:
+    def __init__(self, max_concurrent:int = 2, max_queue:int = 32, max_queue_per_user:int = 2):
+        """
+        Admission control in front of ollama, one scheduler per worker process.
+        At most max_concurrent calls of this process run at once, the others wait in a queue per priority
+        where users take turns, so one user sending many messages does not delay the others.
+        Interactive calls are refused once max_queue calls are waiting (503) or the user already
+        has max_queue_per_user waiting (429). Background calls always queue.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._lock = threading.Lock()
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}  # priority -> user -> tickets
+        self._reserved = []  # Interactive tickets not queued yet, they count against the queue limits
+        self._running = 0
+        self._stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'cancelled': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _waiting(self, priority=None, user=None) -> int:
+        priorities = [priority] if priority is not None else self._queues.keys()
+        count = 0
+        for p in priorities:
+            for queue_user, tickets in self._queues[p].items():
+                if user is None or queue_user == user:
+                    count += len(tickets)
+        if priority in (None, INTERACTIVE):
+            count += len([ticket for ticket in self._reserved if user is None or ticket.user == user])
+        return count
+
+    def _check(self, user):
+        if self._waiting(INTERACTIVE) >= self.max_queue:
+            self._stats['rejected'] += 1
+            raise QueueFull("The server is busy, try again later", status=503)
+        if self._waiting(INTERACTIVE, user) >= self.max_queue_per_user:
+            self._stats['rejected'] += 1
+            raise QueueFull("Too many pending messages, wait for the previous answers", status=429)
+
+    def submit(self, user, priority:int = INTERACTIVE) -> Ticket:
+        """
+        Queue a call, the returned ticket is admitted as soon as a slot is free
+        """
+        ticket = Ticket(self, user, priority)
+        with self._lock:
+            if priority == INTERACTIVE:
+                self._check(user)
+            self._queues[priority].setdefault(user, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def reserve(self, user) -> Ticket:
+        """
+        Take a place in the interactive queue without asking for a slot yet, raises QueueFull like submit.
+        Work done before ticket.enqueue(), like the video tools, does not hold a slot,
+        and nothing is left to undo when the queue is full.
+        """
+        ticket = Ticket(self, user, INTERACTIVE)
+        ticket.state = 'reserved'
+        with self._lock:
+            self._check(user)
+            self._reserved.append(ticket)
+        return ticket
+
+    def enqueue(self, ticket):
+        with self._lock:
+            if ticket.state != 'reserved':
+                return
+            self._reserved.remove(ticket)
+            ticket.state = 'queued'
+            ticket.enqueued_at = time.monotonic()
+            self._queues[ticket.priority].setdefault(ticket.user, deque()).append(ticket)
+            self._dispatch()
+
+    def _dispatch(self):
+        """
+        Admit queued tickets while slots are free, the lock must be held
+        """
+        while self._running < self.max_concurrent:
+            ticket = self._next()
+            if ticket is None:
+                return
+            ticket.state = 'running'
+            self._running += 1
+            waited = time.monotonic() - ticket.enqueued_at
+            self._stats['admitted'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            ticket.admitted.set_result(True)
+
+    def _next(self):
+        """
+        Pop the first ticket of the first user with the highest priority, the user then goes to the back
+        """
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                user, tickets = next(iter(users.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                return ticket
+        return None
+
+    def release(self, ticket):
+        """
+        Free the slot of a running ticket, leave the queue or drop the reservation, calling it twice is harmless
+        """
+        with self._lock:
+            if ticket.state == 'running':
+                self._running -= 1
+            elif ticket.state == 'reserved':
+                self._reserved.remove(ticket)
+                ticket.admitted.cancel()
+            elif ticket.state == 'queued':
+                tickets = self._queues[ticket.priority].get(ticket.user)
+                if tickets is not None and ticket in tickets:
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del self._queues[ticket.priority][ticket.user]
+                ticket.admitted.cancel()
+                self._stats['cancelled'] += 1
+            ticket.state = 'done'
+            self._dispatch()
+
+    def position(self, ticket) -> int:
+        """
+        Position of a queued ticket in the order the queue would be served
+        """
+        with self._lock:
+            if ticket.state != 'queued':
+                return 0
+            position = 0
+            for priority in sorted(self._queues):
+                queues = [list(tickets) for tickets in self._queues[priority].values()]
+                # Users take turns, the n-th ticket of every user comes before the n+1-th of any user
+                for turn in range(max((len(q) for q in queues), default=0)):
+                    for tickets in queues:
+                        if turn < len(tickets):
+                            position += 1
+                            if tickets[turn] is ticket:
+                                return position
+            return position
+
+    def stats(self) -> dict:
+        """
+        Running and queued calls and admission counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = self._running
+            stats['max_concurrent'] = self.max_concurrent
+            stats['queued_interactive'] = self._waiting(INTERACTIVE)
+            stats['queued_background'] = self._waiting(BACKGROUND)
+        return stats
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+# From cached token checks (milliseconds) to video transcriptions (minutes)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200)
+
+STAGE_SECONDS = Histogram('slm_stage_seconds', "Seconds spent in each stage", ['stage'], buckets=SECONDS_BUCKETS)
+REQUEST_SECONDS = Histogram('slm_request_seconds', "Seconds spent in each endpoint, streams included", ['endpoint'], buckets=SECONDS_BUCKETS)
+STAGE_ERRORS = Counter('slm_stage_errors_total', "Stages that raised an exception", ['stage'])
+TIME_TO_FIRST_TOKEN = Histogram('slm_time_to_first_token_seconds', "Seconds from the request to ollama to the first chunk", buckets=SECONDS_BUCKETS)
+GENERATION_SECONDS = Histogram('slm_generation_seconds', "Seconds from the request to ollama to the last chunk", buckets=SECONDS_BUCKETS)
+TOKENS_PER_SECOND = Histogram('slm_generation_tokens_per_second', "Decoding speed reported by ollama", buckets=TOKENS_PER_SECOND_BUCKETS)
+GENERATED_TOKENS = Counter('slm_generated_tokens_total', "Tokens generated by the model")
+PROMPT_TOKENS = Counter('slm_prompt_tokens_total', "Prompt tokens evaluated by the model")
+
+# Trace of the request running in the current thread or task, asyncio.to_thread carries it to worker threads
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+def log(event:str, **fields):
+    """
+    Write one structured log line
+    """
+    print(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, default=str), flush=True)
+
+class RequestTrace:
+    def __init__(self, endpoint:str, **fields):
+        """
+        Timings of one request, logged as a single JSON line by finish().
+        Spans run while the trace is active add their seconds to it, repeated stages are summed.
+        """
+        self.endpoint = endpoint
+        self.fields = fields
+        self.spans = {}
+        self.start = time.perf_counter()
+        self._token = None
+        self._finished = False
+
+    def activate(self) -> "RequestTrace":
+        """
+        Make this the trace of the current thread or task, until deactivate()
+        """
+        self._token = _current_trace.set(self)
+        return self
+
+    def deactivate(self):
+        if self._token is not None:
+            try:
+                _current_trace.reset(self._token)
+            except ValueError:
+                pass  # Closed from another context, e.g. a stream closed after a client disconnect
+            self._token = None
+
+    @contextmanager
+    def active(self):
+        self.activate()
+        try:
+            yield self
+        finally:
+            self.deactivate()
+
+    def add(self, stage:str, seconds:float):
+        self.spans[stage] = round(self.spans.get(stage, 0.0) + seconds, 4)
+
+    def finish(self, **fields):
+        if self._finished:
+            return
+        self._finished = True
+        seconds = time.perf_counter() - self.start
+        REQUEST_SECONDS.labels(self.endpoint).observe(seconds)
+        log('request', endpoint=self.endpoint, seconds=round(seconds, 4), **self.fields, **fields, spans=self.spans)
+
+def annotate(**fields):
+    """
+    Add fields to the log line of the current request
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.fields.update(fields)
+
+@contextmanager
+def span(stage:str):
+    """
+    Time a stage into the stage histogram and the current request trace
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, seconds)
+
+class GenerationTimer:
+    def __init__(self):
+        """
+        Time to first token, total time and decoding speed of one ollama stream
+        """
+        self.start = time.perf_counter()
+        self.first_token = None
+
+    def chunk(self, part):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+            TIME_TO_FIRST_TOKEN.observe(self.first_token)
+        if part.get('done'):
+            self.done(part)
+
+    def done(self, part):
+        seconds = time.perf_counter() - self.start
+        GENERATION_SECONDS.observe(seconds)
+        # Durations reported by ollama are in nanoseconds
+        eval_count = part.get('eval_count') or 0
+        eval_duration = part.get('eval_duration') or 0
+        GENERATED_TOKENS.inc(eval_count)
+        PROMPT_TOKENS.inc(part.get('prompt_eval_count') or 0)
+        tokens_per_second = eval_count / (eval_duration / 1e9) if eval_duration else 0.0
+        if tokens_per_second:
+            TOKENS_PER_SECOND.observe(tokens_per_second)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add('generation.first_token', self.first_token or seconds)
+            trace.add('generation', seconds)
+            annotate(generated_tokens=eval_count, tokens_per_second=round(tokens_per_second, 2))
+
+def render_metrics():
+    """
+    Prometheus text format of every metric, returns (body, content type).
+    With PROMETHEUS_MULTIPROC_DIR set, the metrics of every gunicorn worker are merged.
+    """
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,138 @@
+import hashlib
+from typing import Dict, List, Tuple
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.utils import get_tokenizer
+from .bm25 import tokenize
+from .retrieval_cache import LRUCache
+
+# Same layout as the context chat engine of llama_index
+CONTEXT_TEMPLATE = (
+    "Context information is below."
+    "\n--------------------\n"
+    "{context_str}"
+    "\n--------------------\n"
+)
+
+class PromptBuilder:
+    def __init__(self, max_tokens:int = 1536, history_tokens:int = 512, video_tokens:int = 512,
+                 min_relative_score:float = 0.5, duplicate_overlap:float = 0.8, token_cache_size:int = 4096,
+                 safety_margin:float = 0.1):
+        """
+        Assemble the messages of a chat turn within one token budget.
+        The system prompt and the user input are always sent, video context in the input is cut to video_tokens.
+        The most recent history messages that fit in history_tokens come next, retrieved chunks fill what is left.
+        Chunks with more than duplicate_overlap of their terms in a chunk already kept are dropped.
+        min_relative_score applies to vector similarity scores (dense and prefilter retrieval): chunks below
+        that fraction of the best similarity are dropped. Hybrid scores are reciprocal ranks, which already
+        rank both sides fairly, so chunks found by BM25 alone are never dropped for their score.
+        Tokens are counted with the llama_index default tokenizer (tiktoken), an approximation of the
+        llama3.2 tokenizer: the budget is max_tokens minus safety_margin of it, keep max_tokens below
+        the context window of the model minus the length of the answer.
+        Token counts are cached by text, so stored messages and chunks are tokenized once.
+        """
+        self.max_tokens = max_tokens
+        self.budget = int(max_tokens * (1 - safety_margin))
+        self.history_tokens = history_tokens
+        self.video_tokens = video_tokens
+        self.min_relative_score = min_relative_score
+        self.duplicate_overlap = duplicate_overlap
+        self.token_counts = LRUCache(token_cache_size)
+
+    @property
+    def tokenizer(self):
+        return get_tokenizer()
+
+    def count(self, text:str, cache:bool = True) -> int:
+        if not cache:
+            return len(self.tokenizer(text))
+        key = hashlib.sha1(text.encode()).digest()
+        tokens = self.token_counts.get(key)
+        if tokens is None:
+            tokens = len(self.tokenizer(text))
+            self.token_counts.put(key, tokens)
+        return tokens
+
+    def truncate(self, text:str, max_tokens:int) -> str:
+        """
+        Cut text to at most max_tokens, on a word boundary
+        """
+        # Trial cuts are not cached, they would push the stored messages out of the cache
+        tokens = self.count(text, cache=False)
+        if tokens <= max_tokens:
+            return text
+        # Start from the proportional length and shorten until it fits
+        length = int(len(text) * max_tokens / tokens)
+        while length > 0:
+            cut = text[:length].rsplit(' ', 1)[0] + " ..."
+            if self.count(cut, cache=False) <= max_tokens:
+                return cut
+            length = int(length * 0.9)
+        return ""
+
+    def select_history(self, history:List[Dict[str,str]], budget:int) -> Tuple[List[Dict[str,str]], int]:
+        """
+        Most recent messages that fit in the budget, oldest first
+        """
+        selected, used = [], 0
+        for message in reversed(history):
+            tokens = self.count(message['content'])
+            if used + tokens > budget:
+                break
+            selected.append(message)
+            used += tokens
+        return selected[::-1], used
+
+    def select_chunks(self, nodes:List[NodeWithScore], budget:int, similarity_scores:bool = True) -> Tuple[List[str], int, Dict[str,int]]:
+        """
+        Text of the best chunks that fit in the budget, with the number dropped for each reason
+        similarity_scores: the scores are vector similarities, otherwise the relative score filter is skipped
+        """
+        dropped = {'low_score': 0, 'duplicate': 0, 'budget': 0}
+        nodes = sorted(nodes, key=lambda node: node.score or 0.0, reverse=True)
+        best = (nodes[0].score or 0.0) if nodes else 0.0
+        selected, kept_terms, used = [], [], 0
+        for node in nodes:
+            if similarity_scores and best > 0 and (node.score or 0.0) < self.min_relative_score * best:
+                dropped['low_score'] += 1
+                continue
+            text = node.node.get_content(metadata_mode=MetadataMode.LLM)
+            terms = set(tokenize(text))
+            if any(len(terms & kept) > self.duplicate_overlap * len(terms) for kept in kept_terms):
+                dropped['duplicate'] += 1
+                continue
+            tokens = self.count(text)
+            if used + tokens > budget:
+                dropped['budget'] += 1
+                continue
+            selected.append(text)
+            kept_terms.append(terms)
+            used += tokens
+        return selected, used, dropped
+
+    def build(self, system_prompt:str, history:List[Dict[str,str]], prompt:str, nodes:List[NodeWithScore],
+              similarity_scores:bool = True):
+        """
+        Returns the ollama messages and the token count of each part
+        similarity_scores: False when the node scores are fused ranks (hybrid retrieval)
+        """
+        system_tokens = self.count(system_prompt + "\n" + CONTEXT_TEMPLATE.format(context_str=""))
+        prompt_tokens = self.count(prompt)
+        remaining = max(self.budget - system_tokens - prompt_tokens, 0)
+
+        history, history_tokens = self.select_history(history, min(self.history_tokens, remaining))
+        chunks, chunk_tokens, dropped = self.select_chunks(nodes, remaining - history_tokens, similarity_scores)
+
+        context = "\n\n".join(chunks)
+        messages = [{'role': 'system', 'content': system_prompt + "\n" + CONTEXT_TEMPLATE.format(context_str=context)}]
+        messages += [{'role': message['role'], 'content': message['content']} for message in history]
+        messages.append({'role': 'user', 'content': prompt})
+
+        stats = {
+            'system': system_tokens, 'history': history_tokens, 'history_messages': len(history),
+            'prompt': prompt_tokens, 'chunks': chunk_tokens, 'chunks_kept': len(chunks), 'chunks_dropped': dropped,
+            'total': system_tokens + history_tokens + prompt_tokens + chunk_tokens,
+        }
+        return messages, stats
+
+    def stats(self) -> dict:
+        return {'token_counts': self.token_counts.stats()}
@@ -0,0 +1,92 @@
+import re
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+class ResponseCache:
+    def __init__(self, enabled:bool = False, similarity_threshold:float = 0.95, max_size:int = 512, ttl:float = 3600):
+        """
+        Semantic cache of answers to first-turn questions.
+        A question hits when the cosine similarity of its embedding with a cached question
+        is at least similarity_threshold and both were answered on the same index version.
+        Entries expire after ttl seconds, the least recently used go first once max_size is reached.
+        """
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> {"version", "embedding", "answer", "source_nodes", "expires_at"}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'expired': 0, 'evicted': 0}
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _purge(self, version):
+        """
+        Drop expired entries and entries of older versions of the same index, the lock must be held
+        """
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry['expires_at'] <= now:
+                del self._entries[key]
+                self._stats['expired'] += 1
+            elif entry['version'][0] == version[0] and entry['version'] != version:
+                del self._entries[key]
+
+    def lookup(self, version, embedding) -> Optional[dict]:
+        """
+        Returns {"answer", "source_nodes", "similarity"} of the closest cached question, None on a miss
+        version identifies the index the answer was retrieved from: (folder, generation)
+        """
+        query = self._unit(embedding)
+        with self._lock:
+            self._purge(version)
+            keys = [key for key, entry in self._entries.items() if entry['version'] == version]
+            if keys:
+                similarities = np.stack([self._entries[key]['embedding'] for key in keys]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self._stats['hits'] += 1
+                    entry = self._entries[keys[best]]
+                    return {'answer': entry['answer'], 'source_nodes': entry['source_nodes'], 'similarity': float(similarities[best])}
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, version, embedding, answer:str, source_nodes):
+        with self._lock:
+            self._entries[next(self._ids)] = {
+                'version': version,
+                'embedding': self._unit(embedding),
+                'answer': answer,
+                'source_nodes': source_nodes,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evicted'] += 1
+
+    @staticmethod
+    def chunks(answer:str):
+        """
+        Split a cached answer in word chunks so it is streamed like a generated one
+        """
+        return re.findall(r'\s*\S+', answer) or [answer]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['enabled'] = self.enabled
+        return stats
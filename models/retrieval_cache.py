@@ -0,0 +1,121 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.schema import NodeWithScore
+from .metrics import span, annotate
+
+class LRUCache:
+    def __init__(self, max_size:int):
+        """
+        Thread safe LRU map with hit counters
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        """
+        Remove every entry whose key matches predicate
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class RetrievalCache:
+    def __init__(self, embedding_cache_size:int = 1024, retrieval_cache_size:int = 256, similarity_top_k:int = 2,
+                 mode:str = 'dense', candidates:int = 10, rrf_k:int = 60):
+        """
+        Caches in front of the document index for repeated questions.
+        Query embeddings are keyed by the embedding model and the normalized text, so a repeated
+        question skips the embedding model. Retrieved nodes are keyed by the index folder, its
+        generation and the query embedding: a refresh of the index bumps the generation, which
+        makes the old results unreachable, and they are dropped the first time the new generation is seen.
+        mode, candidates and rrf_k choose between dense, hybrid and BM25 prefiltered search, see DocumentIndex.search
+        """
+        self.similarity_top_k = similarity_top_k
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.embeddings = LRUCache(embedding_cache_size)
+        self.results = LRUCache(retrieval_cache_size)
+        self._generations = {}  # persist_dir -> last generation seen
+        self._generations_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text:str) -> str:
+        # The embedding model is uncased, case and spacing do not change the embedding
+        return " ".join(text.lower().split())
+
+    def get_query_embedding(self, text:str) -> List[float]:
+        embed_model = Settings.embed_model
+        normalized = self.normalize(text)
+        key = (getattr(embed_model, 'model_name', 'default'), normalized)
+        embedding = self.embeddings.get(key)
+        if embedding is None:
+            with span('retrieval.embedding'):
+                embedding = embed_model.get_query_embedding(normalized)
+            self.embeddings.put(key, embedding)
+        return embedding
+
+    @span('retrieval')
+    def retrieve(self, document_index, query:str) -> List[NodeWithScore]:
+        """
+        Top-k nodes of the document index for the query
+        """
+        # Generation after loading, the first load sets it from the manifest.
+        # Indexes are swapped before their generation is bumped, so the index searched below is never older than it
+        document_index.get_index()
+        generation = document_index.generation
+        persist_dir = document_index.persist_dir
+        with self._generations_lock:
+            stale = self._generations.get(persist_dir) != generation
+            self._generations[persist_dir] = generation
+        if stale:
+            self.results.discard(lambda key: key[0] == persist_dir and key[1] != generation)
+
+        embedding = self.get_query_embedding(query)
+        digest = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        key = (persist_dir, generation, self.similarity_top_k, digest)
+        nodes = self.results.get(key)
+        if nodes is None:
+            nodes, timings = document_index.search(
+                query, embedding, self.similarity_top_k, mode=self.mode, candidates=self.candidates, rrf_k=self.rrf_k
+            )
+            annotate(retrieval={'mode': self.mode, 'chunks': len(nodes), **timings})
+            self.results.put(key, nodes)
+        return list(nodes)
+
+    def stats(self) -> dict:
+        return {'query_embeddings': self.embeddings.stats(), 'retrieval': self.results.stats()}
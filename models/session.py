@@ -1,10 +1,17 @@
 from models import db
+from models.token_cache import TokenCache
+from models.metrics import span
 import json
 from datetime import datetime
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 import bcrypt
 
 class session:
+    # Shared by every session of the process, DB round trips saved are visible in token_cache.stats() (/healthz).
+    # Logout and user deletion only clear this process: other gunicorn workers keep accepting
+    # a revoked token until their entry expires, at most ttl (60 s) later.
+    token_cache = TokenCache(ttl=60)
+
     def __init__(self, mydb:db, user:str, token:str):
         """
         Initialize instance from token
@@ -66,6 +73,7 @@ class session:
             OUT out_op_status BOOLEAN        -- Output flag indicating if the user was deleted successfully
         """
         password_hash = session.hash_password(self.mydb, self.user, password)
+        session.token_cache.invalidate_user(self.user)
         params, results = self.mydb.call_proc("DeleteUser",[self.user,password_hash,token,None,None])  
         token_valid = params[-2]
         op_status = params[-1]
@@ -110,19 +118,28 @@ class session:
         token = params[-1]
         if not op_status or not isinstance(token,str):
             raise RuntimeError("User was not able to be authenticated")
+        cls.token_cache.put(user, token, duration_hours * 3600)
         return token
     
     @classmethod
+    @span('auth')
     def verify_token(cls, mydb:db, user:str, token:str):
         """
-        Procedure: VerifyToken
+        Tokens verified recently are answered from token_cache without a database round trip
+        Procedure: VerifyTokenExpiry
         Paramaters:
-            IN in_email VARCHAR(255),  -- Email for additional verification
-            IN in_token VARCHAR(512),  -- Token to be verified
-            OUT out_op_status BOOLEAN  -- Output flag indicating if the token is valid
+            IN in_email VARCHAR(255),    -- Email for additional verification
+            IN in_token VARCHAR(512),    -- Token to be verified
+            OUT out_op_status BOOLEAN,   -- Output flag indicating if the token is valid
+            OUT out_seconds_left INT     -- Seconds until the token expires
         """
-        params, results = mydb.call_proc("VerifyToken",[user,token,None])
-        op_status = params[-1]
+        if cls.token_cache.get(user, token):
+            return True
+        params, results = mydb.call_proc("VerifyTokenExpiry",[user,token,None,None])
+        op_status = params[-2]
+        seconds_left = params[-1]
+        if op_status:
+            cls.token_cache.put(user, token, seconds_left)
         return op_status
 
     
@@ -134,6 +151,7 @@ class session:
             IN in_token VARCHAR(512),  -- Token to be deleted
             OUT out_op_status BOOLEAN  -- Output flag to indicate if the token was successfully deleted
         """
+        session.token_cache.invalidate(self.user, self.token)
         params, results = self.mydb.call_proc("DeleteToken",[self.user,self.token,None])
         op_status = params[-1]
         if not op_status:
@@ -246,6 +264,74 @@ class session:
             raise RuntimeError("Unable to Update conversation")
         
         
+    def update_title(self, conversation_id:str, title:str):
+        """
+        Procedure: UpdateConversationTitle
+        Parameters:
+            IN in_email VARCHAR(255),           -- User's email for validation
+            IN in_token VARCHAR(512),           -- User's token for validation
+            IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+            IN in_title VARCHAR(50),            -- New title for the conversation
+            OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+            OUT out_op_status BOOLEAN           -- Output flag indicating if the title was updated successfully
+        """
+        params, results = self.mydb.call_proc("UpdateConversationTitle",[self.user, self.token, conversation_id, title, None, None])
+        token_valid = params[-2]
+        op_status = params[-1]
+        if not token_valid:
+            raise ValueError("Token used is not valid")
+        elif not op_status:
+            raise RuntimeError("Unable to update title")
+
+    def append_message(self, conversation_id:str, role:str, content:str):
+        """
+        Procedure: AppendMessage
+        Parameters:
+            IN in_email VARCHAR(255),           -- User's email for validation
+            IN in_token VARCHAR(512),           -- User's token for validation
+            IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+            IN in_role VARCHAR(16),             -- Role of the author of the message
+            IN in_content MEDIUMTEXT,           -- Message text
+            OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+            OUT out_op_status BOOLEAN           -- Output flag indicating if the message was appended successfully
+        """
+        params, results = self.mydb.call_proc("AppendMessage",[self.user, self.token, conversation_id, role, content, None, None])
+        token_valid = params[-2]
+        op_status = params[-1]
+        if not token_valid:
+            raise ValueError("Token used is not valid")
+        elif not op_status:
+            raise RuntimeError("Unable to append message")
+
+    def read_last_messages(self, conversation_id:str, limit:Optional[int] = None) -> List[Dict[str,str]]:
+        """
+        Procedure: ReadLastMessages
+        Parameters:
+            IN in_email VARCHAR(255),           -- User's email for validation
+            IN in_token VARCHAR(512),           -- User's token for validation
+            IN in_conversation_id VARCHAR(36),  -- Unique conversation ID
+            IN in_limit INT,                    -- Number of messages to read, NULL reads the whole conversation
+            OUT out_token_valid BOOLEAN,        -- Output flag indicating if the token is valid
+            OUT out_op_status BOOLEAN           -- Output flag indicating if the messages were read successfully
+        Results:
+            - First bracket level is for results from the procedure
+            - Second bracket level is for rows, oldest message first
+            - 3 Level are columns role,content
+            [[(role,content)]]
+        """
+        params, results = self.mydb.call_proc("ReadLastMessages",[self.user, self.token, conversation_id, limit, None, None])
+        token_valid = params[-2]
+        op_status = params[-1]
+        if not token_valid:
+            raise ValueError("Token used is not valid")
+        elif not op_status:
+            raise RuntimeError("Unable to read messages")
+
+        # Conversations stored as JSON before chat_messages existed are copied once by migrate-messages.py
+        if not results:
+            return []
+        return [{'role': role, 'content': content} for role, content in results[0]]
+
     def delete_conversation(self, conversation_id):
         """
         Procedure: DeleteConversation
@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.core.node_parser import TokenTextSplitter
+from llama_index.core.utils import get_tokenizer
+
+SUMMARY_TEMPLATE = """
+Summarize the following video, be as concise as possible unless the user ask, extract some bullet points, you should answer with summary exclusively
+Transcription: {transcription}
+"""
+
+MAP_TEMPLATE = """
+The following text is part {part} of {parts} of a video transcription. Summarize it in a few bullet points, keep names, numbers and facts, you should answer with summary exclusively
+Transcription part: {transcription}
+"""
+
+REDUCE_TEMPLATE = """
+The following bullet points summarize consecutive parts of a video. Merge them into one summary of the whole video, be as concise as possible, extract some bullet points, you should answer with summary exclusively
+Partial summaries:
+{summaries}
+"""
+
+class MapReduceSummarizer:
+    def __init__(self, prompt_fn, chunk_tokens:int = 2000, chunk_overlap:int = 100, parallelism:int = 2):
+        """
+        Summarize long transcriptions without overrunning the context window of the model.
+        The text is split by tokens, chunks are summarized concurrently (map) and the partial
+        summaries are merged (reduce), again in groups if they do not fit in one prompt.
+        prompt_fn takes a list of chat messages and returns the answer text.
+        """
+        self.prompt_fn = prompt_fn
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='summarizer')
+        self._splitter = None
+
+    @property
+    def splitter(self) -> TokenTextSplitter:
+        # Created on first use, the tokenizer may have to be downloaded
+        if self._splitter is None:
+            self._splitter = TokenTextSplitter(chunk_size=self.chunk_tokens, chunk_overlap=self.chunk_overlap)
+        return self._splitter
+
+    @property
+    def tokenizer(self):
+        return get_tokenizer()
+
+    def count_tokens(self, text:str) -> int:
+        return len(self.tokenizer(text))
+
+    def ask(self, content:str) -> str:
+        return self.prompt_fn([{'role': 'user', 'content': content}])
+
+    def summarize(self, transcription:str):
+        """
+        Returns the summary and stats: {"tokens", "chunks", "map_seconds", "reduce_seconds", "reduce_rounds"}
+        """
+        stats = {'tokens': self.count_tokens(transcription), 'chunks': 1, 'map_seconds': 0.0, 'reduce_seconds': 0.0, 'reduce_rounds': 0}
+
+        # Short transcriptions fit in a single prompt
+        if stats['tokens'] <= self.chunk_tokens:
+            start = time.time()
+            summary = self.ask(SUMMARY_TEMPLATE.format(transcription=transcription))
+            stats['map_seconds'] = time.time() - start
+            return summary, stats
+
+        # Map: summarize every chunk concurrently
+        start = time.time()
+        chunks = self.splitter.split_text(transcription)
+        stats['chunks'] = len(chunks)
+        summaries = list(self.executor.map(
+            lambda item: self.ask(MAP_TEMPLATE.format(part=item[0] + 1, parts=len(chunks), transcription=item[1])),
+            enumerate(chunks)
+        ))
+        stats['map_seconds'] = time.time() - start
+
+        # Reduce: merge partial summaries, in groups that fit in one prompt until one is left
+        start = time.time()
+        while True:
+            stats['reduce_rounds'] += 1
+            groups = self.group(summaries)
+            if len(groups) == 1:
+                summary = self.ask(REDUCE_TEMPLATE.format(summaries="\n\n".join(groups[0])))
+                break
+            summaries = list(self.executor.map(
+                lambda group: self.ask(REDUCE_TEMPLATE.format(summaries="\n\n".join(group))),
+                groups
+            ))
+        stats['reduce_seconds'] = time.time() - start
+        return summary, stats
+
+    def group(self, summaries):
+        """
+        Pack consecutive summaries in groups of at most chunk_tokens tokens, at least two per group
+        """
+        groups, current, current_tokens = [], [], 0
+        for summary in summaries:
+            tokens = self.count_tokens(summary)
+            if len(current) >= 2 and current_tokens + tokens > self.chunk_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            groups.append(current)
+        return groups
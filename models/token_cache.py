@@ -0,0 +1,67 @@
+import time
+import threading
+from collections import OrderedDict
+
+class TokenCache:
+    def __init__(self, max_size:int = 4096, ttl:float = 60):
+        """
+        LRU cache of verified (user, token) pairs to skip the VerifyToken round trip.
+        Entries expire after ttl seconds and never outlive the expiration of the token itself.
+        Only valid tokens are cached, invalid ones always go to the database.
+        The cache is per process: a token revoked in one worker stays valid in the others for up to ttl seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user, token) -> monotonic expiry
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user:str, token:str) -> bool:
+        """
+        Return True if the pair was verified recently and is still valid
+        """
+        key = (user, token)
+        with self._lock:
+            expiry = self._entries.get(key)
+            if expiry is not None and expiry > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expiry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False
+
+    def put(self, user:str, token:str, seconds_left:float):
+        """
+        Cache a verified pair, seconds_left is the remaining lifetime of the token
+        """
+        lifetime = min(self.ttl, seconds_left)
+        if lifetime <= 0:
+            return
+        key = (user, token)
+        with self._lock:
+            self._entries[key] = time.monotonic() + lifetime
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user:str, token:str):
+        with self._lock:
+            self._entries.pop((user, token), None)
+
+    def invalidate_user(self, user:str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
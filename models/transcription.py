@@ -0,0 +1,112 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class TranscriptionService:
+    def __init__(self, audio_model, max_batch_size:int = 8, max_wait_ms:float = 50):
+        """
+        Queue in front of Speech2Text that groups concurrent requests in micro-batches.
+        A batch is sent to the pipeline once it has max_batch_size requests or the oldest
+        request waited max_wait_ms, every caller gets its own result back through a Future.
+        """
+        self.audio_model = audio_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'batched_requests': 0,
+            'errors': 0,
+            'max_queue_depth': 0,
+            'batch_sizes': {},  # batch size -> number of batches
+            'busy_seconds': 0.0,
+        }
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """
+        Start the batching thread on first use, threads do not survive a fork so a
+        service created before the server forks its workers starts one in each worker
+        """
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='transcription', daemon=True)
+                    self._worker.start()
+
+    def submit(self, audio) -> Future:
+        """
+        Queue an audio input (file path or {"raw", "sampling_rate"}), the Future resolves to the text
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((audio, future))
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+        return future
+
+    def transcribe(self, audio, timeout:float = None) -> str:
+        return self.submit(audio).result(timeout=timeout)
+
+    def stream_transcript(self, audio):
+        """
+        Transcribe audio window by window through the queue, yields the text of every window as it finishes
+        """
+        return self.audio_model.stream_transcript(audio, transcribe_window=self.transcribe)
+
+    def _next_batch(self):
+        """
+        Block for the first request, then collect more until the batch is full or the wait time is over
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            inputs = [audio for audio, _ in batch]
+            start = time.time()
+            try:
+                texts = self.audio_model.get_transcripts(inputs)
+                for (_, future), text in zip(batch, texts):
+                    future.set_result(text)
+            except Exception:
+                # Retry one by one so a bad input only fails its own request
+                for audio, future in batch:
+                    try:
+                        future.set_result(self.audio_model.get_transcript(audio))
+                    except Exception as e:
+                        with self._stats_lock:
+                            self._stats['errors'] += 1
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                self._stats['batched_requests'] += len(batch)
+                self._stats['batch_sizes'][len(batch)] = self._stats['batch_sizes'].get(len(batch), 0) + 1
+                self._stats['busy_seconds'] += time.time() - start
+
+    def stats(self) -> dict:
+        """
+        Queue depth and batching counters
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['batch_sizes'] = dict(self._stats['batch_sizes'])
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = stats['batched_requests'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
@@ -0,0 +1,197 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+SEARCH_BLOCK_ROWS = 65536  # Rows scored at once, bounds the float32 copy of int8 blocks
+
+def _normalize(vectors:np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+def quantize_int8(vectors:np.ndarray):
+    """
+    Symmetric per-vector int8 quantization, returns (codes, scales) with vectors ~= codes * scales
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping all embeddings in one contiguous NumPy matrix.
+    Vectors are L2 normalized so a matrix product gives the cosine similarity of the default store.
+    Persisted as .npy files that are loaded memory-mapped, so every worker reading the same index
+    shares one copy in the page cache. With quantize, vectors are stored as int8 with one scale per vector.
+    Node texts stay in the docstore, metadata filters are not supported.
+    """
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    quantize: bool = False
+
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _vectors: Optional[np.ndarray] = PrivateAttr(default=None)  # float32, or int8 codes when quantized
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _rows: Optional[Tuple[Dict[str, int], Dict[str, List[int]]]] = PrivateAttr(default=None)  # (node id -> row, ref doc id -> rows)
+
+    def __init__(self, quantize:bool = False, **kwargs: Any):
+        super().__init__(quantize=quantize, **kwargs)
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        size = self._vectors.nbytes if self._vectors is not None else 0
+        return size + (self._scales.nbytes if self._scales is not None else 0)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = _normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        if self.quantize:
+            codes, scales = quantize_int8(vectors)
+            self._vectors = codes if self._vectors is None else np.concatenate([self._vectors, codes])
+            self._scales = scales if self._scales is None else np.concatenate([self._scales, scales])
+        else:
+            self._vectors = vectors if self._vectors is None else np.concatenate([self._vectors, vectors])
+        self._ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id or node.node_id for node in nodes)
+        self._rows = None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        keep = np.array([ref != ref_doc_id for ref in self._ref_doc_ids], dtype=bool)
+        if keep.all():
+            return
+        self._vectors = self._vectors[keep]
+        if self._scales is not None:
+            self._scales = self._scales[keep]
+        self._ids = [i for i, k in zip(self._ids, keep) if k]
+        self._ref_doc_ids = [r for r, k in zip(self._ref_doc_ids, keep) if k]
+        self._rows = None
+
+    def _id_rows(self):
+        """
+        Rows of every node id and of every ref doc id, kept until the next add or delete
+        """
+        if self._rows is None:
+            node_rows = {node_id: i for i, node_id in enumerate(self._ids)}
+            doc_rows = {}
+            for i, ref in enumerate(self._ref_doc_ids):
+                doc_rows.setdefault(ref, []).append(i)
+            self._rows = (node_rows, doc_rows)
+        return self._rows
+
+    def _filter_rows(self, node_ids:Optional[List[str]], doc_ids:Optional[List[str]]) -> np.ndarray:
+        """
+        Sorted rows matching both filters, a None filter matches every row
+        """
+        node_rows, doc_rows = self._id_rows()
+        rows = None
+        if node_ids is not None:
+            rows = np.unique(np.array([node_rows[i] for i in node_ids if i in node_rows], dtype=np.int64))
+        if doc_ids is not None:
+            matches = [row for ref in set(doc_ids) for row in doc_rows.get(ref, ())]
+            doc_matches = np.unique(np.array(matches, dtype=np.int64))
+            rows = doc_matches if rows is None else np.intersect1d(rows, doc_matches, assume_unique=True)
+        return rows
+
+    def _scores(self, query:np.ndarray, rows:Optional[np.ndarray]) -> np.ndarray:
+        """
+        Cosine similarity of the query with every vector, or only with rows
+        """
+        vectors = self._vectors if rows is None else self._vectors[rows]
+        scales = None
+        if self._scales is not None:
+            scales = self._scales if rows is None else self._scales[rows]
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = vectors[start:start + SEARCH_BLOCK_ROWS]
+            if scales is None:
+                scores[start:start + len(block)] = block @ query
+            else:
+                scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+        return scores
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by MmapVectorStore")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(f"Query mode {query.mode} is not supported by MmapVectorStore")
+        if self._vectors is None or not self._ids or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        rows = None
+        if query.node_ids is not None or query.doc_ids is not None:
+            rows = self._filter_rows(query.node_ids, query.doc_ids)
+            if len(rows) == 0:
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        query_vector = _normalize(np.asarray([query.query_embedding], dtype=np.float32))[0]
+        scores = self._scores(query_vector, rows)
+        k = min(query.similarity_top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        positions = top if rows is None else rows[top]
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._ids[i] for i in positions],
+        )
+
+    @staticmethod
+    def _paths(persist_path:str):
+        base = os.path.splitext(persist_path)[0]
+        return base + '.vectors.npy', base + '.scales.npy'
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Ids go to persist_path as JSON, vectors and scales to .npy files next to it.
+        Files are replaced atomically and mapped again, so this process also reads them from the page cache.
+        """
+        os.makedirs(os.path.dirname(persist_path) or '.', exist_ok=True)
+        vectors_path, scales_path = self._paths(persist_path)
+        dtype = np.int8 if self.quantize else np.float32
+        vectors = self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=dtype)
+        arrays = [(vectors_path, vectors)]
+        if self.quantize:
+            arrays.append((scales_path, self._scales if self._scales is not None else np.zeros(0, dtype=np.float32)))
+        for path, array in arrays:
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        with open(persist_path + '.tmp', 'w') as f:
+            json.dump({'quantize': self.quantize, 'ids': self._ids, 'ref_doc_ids': self._ref_doc_ids}, f)
+        os.replace(persist_path + '.tmp', persist_path)
+        self._load_arrays(persist_path)
+
+    def _load_arrays(self, persist_path:str):
+        vectors_path, scales_path = self._paths(persist_path)
+        self._vectors = np.load(vectors_path, mmap_mode='r') if self._ids else None
+        self._scales = np.load(scales_path, mmap_mode='r') if self.quantize and self._ids else None
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs: Optional[Any] = None) -> "MmapVectorStore":
+        with open(persist_path, 'r') as f:
+            data = json.load(f)
+        store = cls(quantize=data['quantize'])
+        store._ids = data['ids']
+        store._ref_doc_ids = data['ref_doc_ids']
+        store._load_arrays(persist_path)
+        return store
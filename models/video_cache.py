@@ -0,0 +1,110 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+VIDEO_ID_PATTERN = re.compile(r'^[\w\-]{11}$')
+
+class VideoCache:
+    def __init__(self, path:str = 'storage/cache/videos.sqlite3', max_bytes:int = 256 * 1024 * 1024):
+        """
+        Persistent cache of YouTube titles, transcripts and summaries keyed by video ID.
+        Stored in SQLite so it is shared by every worker, least recently used videos are evicted
+        once the stored text exceeds max_bytes.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    transcript TEXT,
+                    summary TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_last_access ON videos (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def video_id(url:str) -> Optional[str]:
+        """
+        Normalize the different YouTube url formats to the video ID
+        """
+        parsed = urlparse(url)
+        host = parsed.netloc.lower().split(':')[0]
+        if host.startswith('www.') or host.startswith('m.'):
+            host = host.split('.', 1)[1]
+
+        candidate = None
+        if host == 'youtu.be':
+            candidate = parsed.path.strip('/').split('/')[0]
+        elif host in ('youtube.com', 'music.youtube.com'):
+            if parsed.path == '/watch':
+                candidate = parse_qs(parsed.query).get('v', [None])[0]
+            elif parsed.path.startswith(('/shorts/', '/embed/', '/live/')):
+                candidate = parsed.path.split('/')[2]
+
+        if candidate and VIDEO_ID_PATTERN.match(candidate):
+            return candidate
+        return None
+
+    def get(self, video_id:str) -> Optional[dict]:
+        """
+        Return {"title", "transcript", "summary"} of a cached video or None
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT title, transcript, summary FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE videos SET last_access = ? WHERE video_id = ?", (time.time(), video_id))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {'title': row[0], 'transcript': row[1], 'summary': row[2]}
+
+    def put(self, video_id:str, title:str, transcript:str, summary:str):
+        """
+        Store a processed video and evict the least recently used ones over the size limit
+        """
+        size = sum(len((text or '').encode('utf-8')) for text in (title, transcript, summary))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO videos (video_id, title, transcript, summary, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, title, transcript, summary, size, now, now)
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM videos").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = conn.execute("SELECT video_id, size FROM videos ORDER BY last_access LIMIT 1").fetchone()
+                if oldest is None or oldest[0] == video_id:
+                    break
+                conn.execute("DELETE FROM videos WHERE video_id = ?", (oldest[0],))
+                total -= oldest[1]
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM videos").fetchone()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'videos': count, 'bytes': total}
@@ -0,0 +1,59 @@
+import io
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pytube import YouTube
+from .metrics import span
+
+class VideoPipeline:
+    def __init__(self, audio_model, max_workers:int = 4, max_transcriptions:int = 1):
+        """
+        Download and transcribe YouTube videos.
+        Each job keeps its audio in its own memory buffer so concurrent jobs never share files.
+        Downloads run in parallel across videos, transcription is bounded by
+        max_transcriptions because every job shares the same Whisper pipeline.
+        """
+        self.audio_model = audio_model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='video')
+        self.transcription_slots = threading.BoundedSemaphore(max_transcriptions)
+
+    @staticmethod
+    def download_audio(url:str):
+        """
+        Download the audio stream of a video to memory, returns the title and a buffer with the audio
+        """
+        yt = YouTube(url)
+        video_title = yt.title  # Get the video title
+        audio_stream = yt.streams.filter(only_audio=True).first()
+        buffer = io.BytesIO()
+        audio_stream.stream_to_buffer(buffer)
+        buffer.seek(0)
+        return video_title, buffer
+
+    def transcribe(self, url:str) -> dict:
+        """
+        Run one job, returns {"url", "title", "transcription", "timings"} with the seconds spent per stage
+        Audio is decoded in windows while it is transcribed, nothing is written to disk
+        """
+        timings = {}
+        start = time.time()
+        with span('youtube.download'):
+            video_title, audio = self.download_audio(url)
+        timings['download'] = time.time() - start
+
+        stage = time.time()
+        with self.transcription_slots:
+            timings['transcription_wait'] = time.time() - stage
+            with span('youtube.transcribe'):
+                transcription = self.audio_model.get_long_transcript(audio)
+        timings['transcribe'] = time.time() - stage - timings['transcription_wait']
+
+        timings['total'] = time.time() - start
+        return {'url': url, 'title': video_title, 'transcription': transcription, 'timings': timings}
+
+    def map(self, fn, urls):
+        """
+        Run fn on every url in parallel, results keep the order of urls and errors are raised
+        """
+        futures = [self.executor.submit(fn, url) for url in urls]
+        return [future.result() for future in futures]
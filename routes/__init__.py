@@ -1,13 +1,44 @@
-from flask import Blueprint
+from flask import request, g
+from models.metrics import RequestTrace
 from routes.main import main_bp
 from routes.user import user_bp
 from routes.audio import audio_bp
 from routes.chat import chat_bp
+from routes.health import health_bp
+from routes.documents import documents_bp
+
+# Health checks and metric scrapes are not logged
+UNTRACED_BLUEPRINTS = ('health',)
+
+def start_trace():
+    # Requests are labeled by route, unknown paths would create a label each
+    if request.url_rule is None or request.blueprint in UNTRACED_BLUEPRINTS:
+        return
+    g.trace = RequestTrace(request.url_rule.rule, method=request.method, user=request.values.get('user')).activate()
+
+def trace_status(response):
+    if 'trace' in g:
+        g.trace.fields['status'] = response.status_code
+    return response
+
+def finish_trace(error=None):
+    # Streams are torn down once the last event is sent, so the trace covers the whole stream
+    trace = g.pop('trace', None)
+    if trace is not None:
+        trace.deactivate()
+        trace.finish(**({'error': type(error).__name__} if error else {}))
 
 def register_routes(app):
+    # Per request timings, see models/metrics.py
+    app.before_request(start_trace)
+    app.after_request(trace_status)
+    app.teardown_request(finish_trace)
+
     # Register blueprints
     app.register_blueprint(main_bp)
     app.register_blueprint(user_bp)
     app.register_blueprint(audio_bp)
     app.register_blueprint(chat_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(documents_bp)
     
\ No newline at end of file
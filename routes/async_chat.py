@@ -0,0 +1,164 @@
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.routing import Route
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from models import *
+from models.metrics import RequestTrace
+from routes.chat import start_turn, chat_data_folder, COLLECTIONS, chat_event, title_event, queue_event, TITLE_WAIT_SECONDS, QUEUE_EVENT_SECONDS
+
+# Video tools, index loads and retrieval take seconds each, they get their own threads so a burst of them
+# never takes the threads of the default executor that the short database calls run on
+CHAT_WORK = ThreadPoolExecutor(max_workers=int(os.environ.get('CHAT_WORK_THREADS', 8)), thread_name_prefix='chat-work')
+
+async def run_chat_work(func, *args):
+    """
+    Run a slow blocking call on the chat work threads, the request trace goes with it like in asyncio.to_thread
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(CHAT_WORK, functools.partial(context.run, func, *args))
+
+
+async def stream_send(request: Request):
+    """
+    Async version of /stream-send with the same arguments and events.
+    Generations are coroutines instead of threads, the request to ollama
+    is closed as soon as the client disconnects.
+    """
+    # Extract arguments
+    user = request.query_params.get('user')
+    token = request.query_params.get('token')
+    conversation_id = request.query_params.get('conversation_id')
+    message = request.query_params.get('message')
+    collection = request.query_params.get('collection', 'shared')
+    mydb = request.app.state.mydb
+    slm = request.app.state.slm
+
+    # Check for bad input
+    if user is None or token is None or message is None or collection not in COLLECTIONS:
+        return JSONResponse({'error': 'Bad input arguments', 'status':400}, status_code=400)
+
+    # Create session instance, database calls block so they run in threads
+    try:
+        ss = await asyncio.to_thread(session, mydb, user, token)
+    except:
+        return JSONResponse({'error': 'Unable to get authorization','status':401}, status_code=401)
+
+    # Take a place in the model queue before anything is saved, a full queue leaves no message without an answer
+    try:
+        ticket = slm.scheduler.reserve(user)
+    except QueueFull as e:
+        return JSONResponse({'error': str(e), 'status': e.status}, status_code=e.status)
+
+    # Handle conversation creation or updating, only the new message is written
+    try:
+        conversation_id, conversation, title_future = await asyncio.to_thread(start_turn, slm, ss, conversation_id, message)
+    except:
+        ticket.release()
+        return JSONResponse({'error':'Internal server error', 'status':500}, status_code=500)
+
+
+    # Streaming response
+    async def generate():
+        nonlocal title_future
+        # Send the conversation_id as an event for the stream
+        yield f"event: conversation_id\ndata: {conversation_id}\n\n"
+
+        try:
+            # Video tools run before queueing, their summaries are queued as background calls
+            data_folder = await run_chat_work(chat_data_folder, slm, user, collection)
+            prepared = await run_chat_work(slm.prepare_chat, conversation, data_folder)
+
+            out = ""
+            cached = await run_chat_work(slm.cached_answer, conversation, prepared)
+            if cached is not None:
+                # A similar first question was answered on the same documents, the model is not needed
+                ticket.release()
+                for chunk in ResponseCache.chunks(cached['answer']):
+                    out += chunk
+                    yield chat_event(chunk)
+            else:
+                # Wait for a slot of the model, the client gets its position meanwhile
+                ticket.enqueue()
+                try:
+                    admitted = asyncio.wrap_future(ticket.admitted)
+                    while ticket.position() > 0:
+                        yield queue_event(ticket)
+                        await asyncio.wait([admitted], timeout=QUEUE_EVENT_SECONDS)
+
+                    async for chunk in slm.achat(chat_history=conversation, data_folder=data_folder, prepared=prepared):
+                        out += chunk
+                        yield chat_event(chunk)
+
+                        # Send the title as soon as it is ready
+                        if title_future is not None and title_future.done():
+                            yield title_event(title_future)
+                            title_future = None
+                finally:
+                    ticket.release()
+                await run_chat_work(slm.remember_answer, conversation, prepared, out)
+
+            # Add response from the model to conversation and save it
+            await asyncio.to_thread(ss.append_message, conversation_id, 'assistant', out)
+
+            # Wait a little for a pending title, asyncio.wait does not cancel it on timeout
+            if title_future is not None:
+                await asyncio.wait([asyncio.wrap_future(title_future)], timeout=TITLE_WAIT_SECONDS)
+                yield title_event(title_future)
+
+            # Send last message
+            end_message = json.dumps({"endOfMessage": True})
+            yield f"event: chat\ndata: {end_message}\n\n"
+
+        except asyncio.CancelledError:
+            ticket.release()
+            raise  # Client disconnected, achat already closed the request to ollama
+        except Exception as e:
+            ticket.release()
+            error = json.dumps({'error':'Internal server error', 'status':500})
+            yield f"event: error\ndata: {error}\n\n"
+
+    # The stream may be closed before it starts
+    return StreamingResponse(generate(), media_type='text/event-stream', background=BackgroundTask(ticket.release))
+
+
+async_chat_routes = [
+    Route('/stream-send', stream_send, methods=['GET']),
+]
+
+
+class TraceMiddleware:
+    def __init__(self, app, paths):
+        """
+        Per request timings of the async endpoints, same log line as the Flask endpoints.
+        The trace stays active while the response streams, asyncio.to_thread and run_chat_work carry it to the blocking calls.
+        """
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        query = dict(parse_qsl(scope.get('query_string', b'').decode()))
+        trace = RequestTrace(scope['path'], method=scope['method'], user=query.get('user'))
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                trace.fields['status'] = message['status']
+            await send(message)
+
+        error = None
+        with trace.active():
+            try:
+                await self.app(scope, receive, send_with_status)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                trace.finish(**({'error': error} if error else {}))
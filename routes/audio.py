@@ -1,9 +1,6 @@
 from flask import Blueprint, request, jsonify, Response,stream_with_context,current_app
-from werkzeug.utils import secure_filename
 from models import *
-import time
-import uuid
-import os
+import json
 
 
 audio_bp = Blueprint('audio',__name__)
@@ -12,8 +9,8 @@ audio_bp = Blueprint('audio',__name__)
 @audio_bp.route('/upload-audio', methods=['POST'])
 def upload_audio():
     """
-    Endpoint to transcribe user audio and save it temporarily in user-specific folders.
-    Applies token verification, file cleanup, and error handling.
+    Endpoint to transcribe user audio, the upload is decoded window by window and never written to disk.
+    Applies token verification and error handling.
     """
 
     # 1. Extract request arguments
@@ -37,36 +34,63 @@ def upload_audio():
     
     file = request.files['audioFile']
 
-    # 5. Create user-specific folder in uploaded_audios/
-    user_folder = os.path.join('uploaded_audios', secure_filename(user))
-    os.makedirs(user_folder, exist_ok=True)
-
-    # 6. Clean up files older than 1 hour
-    now = time.time()
-    for f in os.listdir(user_folder):
-        file_path = os.path.join(user_folder, f)
-        if os.path.isfile(file_path):
-            file_creation_time = os.path.getctime(file_path)
-            if now - file_creation_time > 3600:  # Older than 1 hour
-                os.remove(file_path)
-
-    # 7. Generate unique filename and save the file
-    unique_filename = f"{uuid.uuid4()}.wav"
-    file_path = os.path.join(user_folder, unique_filename)
-    file.save(file_path)
-
     try:
-        # 8. Process the audio (e.g., transcribe it)
-        transcription = current_app.slm.audio_model.get_transcript(file_path)
-        
-        # 9. Delete the file after processing
-        os.remove(file_path)
+        # 5. Transcribe the upload in overlapping windows, only one window is decoded in memory at a time.
+        # Windows of concurrent uploads are batched by the transcriber
+        transcription = " ".join(current_app.slm.transcriber.stream_transcript(file.stream))
 
         return jsonify({'transcription': transcription})
     
     except Exception:
-        # Ensure the file is deleted if an error occurs during processing
-        if os.path.exists(file_path):
-            os.remove(file_path)
         return jsonify({'error': 'Failed to process audio'}), 500
 
+
+# Streaming variant of the Upload Audio Endpoint
+@audio_bp.route('/stream-upload-audio', methods=['POST'])
+def stream_upload_audio():
+    """
+    Endpoint to transcribe user audio on Stream, every transcribed window is sent as an 'event: partial'
+    followed by an 'event: final' with the whole transcription.
+    """
+
+    # 1. Extract request arguments
+    user = request.form.get('user')
+    token = request.form.get('token')
+
+    # 2. Check for bad input
+    if user is None or token is None:
+        return jsonify({'error': 'Bad input arguments', 'status':400}), 400
+
+    # 3. Verify the token
+    try:
+        if not session.verify_token(current_app.mydb, user, token):
+            return jsonify({'error': 'Unauthorized access, invalid token', 'status':401}), 401
+    except Exception:
+        return jsonify({'error': 'Token verification failed', 'status':500}), 500
+
+    # 4. Get Audio from the request
+    if 'audioFile' not in request.files:
+        return jsonify({'error': 'No file uploaded', 'status':400}), 400
+
+    audio = request.files['audioFile'].read()
+    transcriber = current_app.slm.transcriber
+
+    # Streaming response
+    def generate():
+        try:
+            parts = []
+            for text in transcriber.stream_transcript(audio):
+                parts.append(text)
+                data = json.dumps({"transcription": text, "endOfMessage": False})
+                yield f"event: partial\ndata: {data}\n\n"
+
+            # Send whole transcription
+            end_message = json.dumps({"transcription": " ".join(parts), "endOfMessage": True})
+            yield f"event: final\ndata: {end_message}\n\n"
+
+        except Exception:
+            error = json.dumps({'error':'Failed to process audio', 'status':500})
+            yield f"event: error\ndata: {error}\n\n"
+            return # Close conection
+
+    return Response(stream_with_context(generate()), content_type='text/event-stream')
@@ -1,9 +1,81 @@
 from flask import Blueprint, request, jsonify, Response,stream_with_context, current_app
+from concurrent.futures import ThreadPoolExecutor
 import os
 from models import *
 
 chat_bp = Blueprint('chat',__name__)
 
+# Number of previous messages replayed to the model on every turn
+HISTORY_LIMIT = 20
+
+# Titles are generated in the background, new conversations start with a placeholder
+PLACEHOLDER_TITLE = "New conversation"
+TITLE_WAIT_SECONDS = 5  # How long the end of the stream waits for a pending title
+title_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='title')
+
+# Seconds between queue position events while a message waits for the model
+QUEUE_EVENT_SECONDS = 1
+
+# Documents a conversation can use, "personal" is the collection uploaded with /upload-document
+COLLECTIONS = ('shared', 'personal')
+
+
+def generate_title(slm, ss, conversation_id, message):
+    """
+    Create the title of a new conversation with the LM and save it
+    """
+    title = slm.create_title(message, user=ss.user)
+    ss.update_title(conversation_id, title)
+    return title
+
+def start_turn(slm, ss, conversation_id, message):
+    """
+    Create the conversation if needed and save the user message, shared by the sync and async /stream-send
+    Returns (conversation_id, conversation, title_future), title_future is None for existing conversations
+    """
+    title_future = None
+    if conversation_id is None:
+        conversation = []
+        conversation_id = ss.create_conversation(PLACEHOLDER_TITLE,conversation)
+        title_future = title_executor.submit(generate_title, slm, ss, conversation_id, message)
+    else:
+        conversation = ss.read_last_messages(conversation_id, HISTORY_LIMIT)
+    ss.append_message(conversation_id, 'user', message)
+    conversation.append({'role': 'user', 'content': message})
+    return conversation_id, conversation, title_future
+
+def chat_data_folder(slm, user, collection):
+    """
+    Folder the answers are grounded on: the shared data folder, or the user's own documents for collection=personal
+    """
+    if collection == 'personal':
+        data_folder = slm.collection_folder(user)
+        os.makedirs(data_folder, exist_ok=True)
+        return data_folder
+    return os.path.join(os.getcwd(),'data')
+
+def chat_event(chunk):
+    data = json.dumps({"response": chunk, "endOfMessage": False})
+    return f"event: chat\ndata: {data}\n\n"
+
+def queue_event(ticket):
+    """
+    SSE event with the position of the message in the model queue
+    """
+    data = json.dumps({"position": ticket.position()})
+    return f"event: queue\ndata: {data}\n\n"
+
+def title_event(title_future):
+    """
+    SSE event with the generated title, empty if the title could not be created
+    """
+    try:
+        title = title_future.result(timeout=0)
+    except Exception:
+        return ""
+    data = json.dumps({"title": title})
+    return f"event: title\ndata: {data}\n\n"
+
 
 @chat_bp.route('/get-chat-history', methods=['GET'])
 def get_chat_history():
@@ -53,7 +125,7 @@ def get_conversation():
         return jsonify({'error': 'Unable to get authorization'}), 401
     
     try:
-        conversation = ss.read_conversation(conversation_id)
+        conversation = ss.read_last_messages(conversation_id)
     except:
         return jsonify({'error':'Internal server error'}),500
 
@@ -98,9 +170,10 @@ def stream_send():
     token = request.args.get('token')
     conversation_id = request.args.get('conversation_id')
     message = request.args.get('message')
+    collection = request.args.get('collection', 'shared')
     
     # Check for bad input
-    if user is None or token is None or message is None:
+    if user is None or token is None or message is None or collection not in COLLECTIONS:
         return jsonify({'error': 'Bad input arguments', 'status':400}), 400
     
     # Create session instance
@@ -109,45 +182,83 @@ def stream_send():
     except:
         return jsonify({'error': 'Unable to get authorization','status':401}), 401
     
-    # Handle conversation creation or updating
+    # Take a place in the model queue before anything is saved, a full queue leaves no message without an answer
+    slm = current_app.slm
     try:
-        if conversation_id is None:
-            conversation = [{'role': 'user', 'content': message}]
-            title = current_app.slm.create_title(message)
-            conversation_id = ss.create_conversation(title,conversation)
-        else:
-            conversation = ss.read_conversation(conversation_id)
-            conversation.append({'role': 'user', 'content': message})
-            ss.update_conversation(conversation_id,conversation)
+        ticket = slm.scheduler.reserve(user)
+    except QueueFull as e:
+        return jsonify({'error': str(e), 'status': e.status}), e.status
+
+    # Handle conversation creation or updating, only the new message is written
+    try:
+        conversation_id, conversation, title_future = start_turn(slm, ss, conversation_id, message)
     except:
+        ticket.release()
         return jsonify({'error':'Internal server error', 'status':500}),500
 
 
     # Streaming response
     def generate():
+        nonlocal title_future
         # Send the conversation_id as an event for the stream
         yield f"event: conversation_id\ndata: {conversation_id}\n\n"
 
         try:
-            # Call Ollama with streaming enabled and stream chat response
-            stream = current_app.slm.chat(chat_history=conversation, data_folder=os.path.join(os.getcwd(),'data'), is_stream=True)
+            # Video tools run before queueing, their summaries are queued as background calls
+            data_folder = chat_data_folder(slm, user, collection)
+            prepared = slm.prepare_chat(conversation, data_folder)
+
             out=""
-            for chunk in stream.response_gen:
-                out+= chunk
-                data = json.dumps({"response": chunk, "endOfMessage": False})
-                yield f"event: chat\ndata: {data}\n\n"   
+            cached = slm.cached_answer(conversation, prepared)
+            if cached is not None:
+                # A similar first question was answered on the same documents, the model is not needed
+                ticket.release()
+                for chunk in ResponseCache.chunks(cached['answer']):
+                    out+= chunk
+                    yield chat_event(chunk)
+            else:
+                # Wait for a slot of the model, the client gets its position meanwhile
+                ticket.enqueue()
+                try:
+                    while ticket.position() > 0:
+                        yield queue_event(ticket)
+                        ticket.wait(timeout=QUEUE_EVENT_SECONDS)
+
+                    # Call Ollama with streaming enabled and stream chat response
+                    stream = slm.chat(chat_history=conversation, data_folder=data_folder, is_stream=True, prepared=prepared)
+                    for chunk in stream:
+                        out+= chunk
+                        yield chat_event(chunk)
+
+                        # Send the title as soon as it is ready
+                        if title_future is not None and title_future.done():
+                            yield title_event(title_future)
+                            title_future = None
+                finally:
+                    ticket.release()
+                slm.remember_answer(conversation, prepared, out)
             
             # Add response from the model to conversation and save it
-            conversation.append({'role': 'assistant', 'content': out})
-            ss.update_conversation(conversation_id,conversation)
+            ss.append_message(conversation_id, 'assistant', out)
+
+            # Wait a little for a pending title, otherwise the client gets it from /get-chat-history
+            if title_future is not None:
+                try:
+                    title_future.result(timeout=TITLE_WAIT_SECONDS)
+                except Exception:
+                    pass
+                yield title_event(title_future)
 
             # Send last message
             end_message = json.dumps({"endOfMessage": True})
             yield f"event: chat\ndata: {end_message}\n\n"
-        
+
         except Exception as e:
+            ticket.release()
             error = json.dumps({'error':'Internal server error', 'status':500})
             yield f"event: error\ndata: {error}\n\n"
             return # Close conection
         
-    return Response(stream_with_context(generate()), content_type='text/event-stream')
\ No newline at end of file
+    response = Response(stream_with_context(generate()), content_type='text/event-stream')
+    response.call_on_close(ticket.release)  # The stream may be closed before it starts
+    return response
\ No newline at end of file
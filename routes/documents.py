@@ -0,0 +1,126 @@
+from flask import Blueprint, request, jsonify, current_app
+from werkzeug.utils import secure_filename
+import os
+from models import *
+
+
+documents_bp = Blueprint('documents',__name__)
+
+# Files the document reader can parse
+ALLOWED_EXTENSIONS = {'.txt', '.md', '.pdf', '.docx', '.csv', '.html', '.json'}
+
+
+def verify(args):
+    """
+    Check the user and token of a request, returns (user, None) or (None, error response)
+    """
+    user = args.get('user')
+    token = args.get('token')
+    if user is None or token is None:
+        return None, (jsonify({'error': 'Bad input arguments'}), 400)
+    try:
+        if not session.verify_token(current_app.mydb, user, token):
+            return None, (jsonify({'error': 'Unauthorized access, invalid token'}), 401)
+    except Exception:
+        return None, (jsonify({'error': 'Token verification failed'}), 500)
+    return user, None
+
+def list_files(data_folder):
+    if not os.path.isdir(data_folder):
+        return []
+    return [
+        {'name': name, 'size': os.path.getsize(os.path.join(data_folder, name))}
+        for name in sorted(os.listdir(data_folder))
+        if not name.startswith('.') and os.path.isfile(os.path.join(data_folder, name))
+    ]
+
+
+# Upload Document Endpoint
+@documents_bp.route('/upload-document', methods=['POST'])
+def upload_document():
+    """
+    Endpoint to add a file to the personal collection of the user, the collection index is updated before answering.
+    Chats use the collection with collection=personal on /stream-send.
+    """
+    # 1. Verify the user and token
+    user, error = verify(request.form)
+    if error:
+        return error
+
+    # 2. Get the file from the request
+    if 'document' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    file = request.files['document']
+    name = secure_filename(file.filename or '')
+    if not name or os.path.splitext(name)[1].lower() not in ALLOWED_EXTENSIONS:
+        return jsonify({'error': 'Unsupported file type'}), 400
+
+    # 3. Check the size limit without keeping more than the limit in memory
+    slm = current_app.slm
+    max_bytes = slm.config.get('collections', {}).get('max_upload_mb', 20) * 1024 * 1024
+    content = file.stream.read(max_bytes + 1)
+    if len(content) > max_bytes:
+        return jsonify({'error': 'File too large'}), 413
+
+    try:
+        # 4. Write the file atomically, hidden files are skipped by a refresh running meanwhile
+        data_folder = slm.collection_folder(user)
+        os.makedirs(data_folder, exist_ok=True)
+        path = os.path.join(data_folder, name)
+        part = os.path.join(data_folder, f".{name}.part")
+        with open(part, 'wb') as f:
+            f.write(content)
+        os.replace(part, path)
+
+        # 5. Embed the new file, only this user's index is touched
+        stats = slm.get_document_index(data_folder).refresh()
+        return jsonify({'message': f'{name} uploaded successfully', 'name': name, 'index': stats})
+
+    except Exception:
+        return jsonify({'error': 'Failed to index document'}), 500
+
+
+# List Documents Endpoint
+@documents_bp.route('/list-documents', methods=['GET'])
+def list_documents():
+    """
+    Endpoint to list the files of the personal collection of the user
+    """
+    # 1. Verify the user and token
+    user, error = verify(request.args)
+    if error:
+        return error
+
+    # 2. Read the collection folder
+    try:
+        return jsonify({'documents': list_files(current_app.slm.collection_folder(user))})
+    except Exception:
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+# Delete Document Endpoint
+@documents_bp.route('/delete-document', methods=['DELETE'])
+def delete_document():
+    """
+    Endpoint to remove a file from the personal collection of the user, its chunks are removed from the index
+    """
+    # 1. Verify the user and token
+    user, error = verify(request.args)
+    if error:
+        return error
+
+    # 2. Find the file, names are sanitized the same way as on upload
+    slm = current_app.slm
+    name = secure_filename(request.args.get('name') or '')
+    data_folder = slm.collection_folder(user)
+    path = os.path.join(data_folder, name)
+    if not name or not os.path.isfile(path):
+        return jsonify({'error': 'Document not found'}), 404
+
+    try:
+        # 3. Remove the file and its chunks
+        os.remove(path)
+        stats = slm.get_document_index(data_folder).refresh()
+        return jsonify({'message': f'{name} deleted successfully', 'index': stats}), 200
+    except Exception:
+        return jsonify({'error': 'Internal server error'}), 500
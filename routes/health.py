@@ -0,0 +1,45 @@
+from flask import Blueprint, Response, jsonify, current_app
+from models.metrics import render_metrics
+from models import session
+
+health_bp = Blueprint('health',__name__)
+
+# Readiness Endpoint
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Report every component. Auth and history only need the database, so the service
+    answers 200 as soon as it is reachable and "status" tells if the models are loaded yet.
+    Cache sizes and hit rates are included, and the usage of the database pool.
+    """
+    # 1. Models and ollama
+    components = current_app.slm.status()
+
+    # 2. Database
+    try:
+        current_app.mydb.ping()
+        components['database'] = {'state': 'ready', 'error': None}
+    except Exception as e:
+        components['database'] = {'state': 'unavailable', 'error': str(e)}
+
+    if components['database']['state'] != 'ready':
+        status, code = 'unavailable', 503
+    elif all(component['state'] == 'ready' for component in components.values()):
+        status, code = 'ready', 200
+    else:
+        status, code = 'starting', 200
+    return jsonify({
+        'status': status, 'components': components,
+        'caches': {**current_app.slm.cache_stats(), 'tokens': session.token_cache.stats()}, 'database_pool': current_app.mydb.stats()
+    }), code
+
+
+# Metrics Endpoint
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus histograms and counters of the request stages: auth, database procedures, index loading,
+    retrieval, generation, Whisper and YouTube
+    """
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
@@ -1,18 +1,57 @@
-from models import *
 from config import load_config
 from flask import Flask
-from routes import register_routes
+import os
+import threading
 
-# Load Config
-myconfig = load_config()
+app = None
+index_watcher = None
 
-# Create Web App
-app = Flask(__name__)
-app.mydb = db(myconfig)
-app.slm = SLM(model_name='llama3.2')
-register_routes(app)
+def create_app():
+    """
+    Create the Web App once per process, later calls return the same app.
+    Nothing is loaded on import: the document parsing workers are spawned and import the main module again.
+    """
+    global app
+    if app is None:
+        from models import db, SLM
+        from routes import register_routes
+
+        # Load Config
+        myconfig = load_config()
+        slm_config = load_config('config/slm.json')
+
+        # Create Web App
+        app = Flask(__name__)
+        app.mydb = db(myconfig)
+        app.slm = SLM(model_name=slm_config['model_name'], config=slm_config)
+        register_routes(app)
+    return app
+
+# Keep the index of the data folder in sync with its files, once the embedding model is loaded
+def start_index_watcher():
+    global index_watcher
+    from models import IndexWatcher
+    slm = create_app().slm
+    data_folder = os.path.join(os.getcwd(),'data')
+    index_watcher = IndexWatcher(slm.get_document_index(data_folder), slm.config['index_watch_interval'])
+    index_watcher.start()
+
+def start_background():
+    """
+    Load the models in background threads and start the index watcher, the app serves requests meanwhile.
+    Called once per serving process: here for the dev server, in post_fork for gunicorn workers.
+    """
+    create_app().slm.warmup()
+    threading.Thread(target=start_index_watcher, name='index-watcher-start', daemon=True).start()
+
+def stop_background():
+    if index_watcher is not None:
+        index_watcher.stop()
 
 
 # Start the Flask application if this script is executed directly
+# Production: gunicorn -c gunicorn.conf.py 'run:create_app()'
 if __name__ == '__main__':
-    app.run(host="0.0.0.0",port=5000,debug=True)  # Enable debug mode for development purposes
\ No newline at end of file
+    create_app()
+    start_background()
+    app.run(host="0.0.0.0",port=5000,debug=True)  # Enable debug mode for development purposes
@@ -119,6 +119,17 @@ export async function sendMessage(user, token, message, conversationId = null) {
             }
         });
 
+        // Handle the title event (titles of new conversations are generated in the background)
+        eventSource.addEventListener("title", () => {
+            updateChatHistoryBar();
+        });
+
+        // Handle queue events, the position is shown until the first chunk of the answer replaces it
+        eventSource.addEventListener("queue", (event) => {
+            const data = JSON.parse(event.data);
+            [incomingMessage] = addIncomingMessage(`Waiting for the assistant, position ${data.position} in the queue...`, incomingMessage, '');
+        });
+
         // Handle chat events (streamed message chunks)
         eventSource.addEventListener("chat", (event) => {
             const data = JSON.parse(event.data);
@@ -235,3 +246,69 @@ export async function transcribeAudio(audioChunks) {
         return null;
     }
 }
+
+/**
+ * Transcribes the recorded audio using the streaming server API.
+ * Partial transcriptions are passed to onPartial as each audio window is transcribed.
+ * @param {Blob[]} audioChunks - The recorded audio chunks to transcribe.
+ * @param {function(string)} onPartial - Called with the text transcribed so far.
+ * @returns {string|null} - The transcribed text or null if there was an error.
+ */
+export async function streamTranscribeAudio(audioChunks, onPartial) {
+    const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
+    const formData = new FormData();
+    formData.append('audioFile', audioBlob);
+
+    const user = getUser();
+    const token = getToken();
+    formData.append('user', user);
+    formData.append('token', token);
+
+    try {
+        const response = await fetch('/stream-upload-audio', {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok) {
+            throw new Error('Failed to transcribe audio.');
+        }
+
+        // EventSource only supports GET, the SSE events are parsed from the response body
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let partialText = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let separator;
+            while ((separator = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, separator);
+                buffer = buffer.slice(separator + 2);
+
+                let eventName = 'message';
+                let eventData = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) eventData += line.slice(6);
+                }
+
+                const data = JSON.parse(eventData);
+                if (eventName === 'partial') {
+                    partialText = partialText ? `${partialText} ${data.transcription}` : data.transcription;
+                    onPartial(partialText);
+                } else if (eventName === 'final') {
+                    return data.transcription;
+                } else if (eventName === 'error') {
+                    throw new Error(data.error);
+                }
+            }
+        }
+        throw new Error('Transcription stream closed early.');
+    } catch (error) {
+        console.error('Error transcribing audio:', error);
+        return null;
+    }
+}
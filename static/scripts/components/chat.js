@@ -1,5 +1,5 @@
 import { getUser, getToken, getConversationId, setConversationId, setAudioChunks, getAudioChunks, getMediaRecorder, setMediaRecorder } from '../state.js';
-import { sendMessage, getChatHistory, loadConversation, transcribeAudio, deleteConversation } from '../api.js';
+import { sendMessage, getChatHistory, loadConversation, streamTranscribeAudio, deleteConversation } from '../api.js';
 /**
  * Chat component that handles sending and receiving chat messages.
  */
@@ -291,7 +291,12 @@ function stopRecording() {
     document.getElementById("stopRecord").disabled = true;
     mediaRecorder.onstop = async () => {
         const audioChunks = getAudioChunks();  // Retrieve audio chunks from state
-        const transcription = await transcribeAudio(audioChunks);
+        const chatInput = document.getElementById('chat-input');
+        // Show partial transcriptions in the input while the rest of the audio is processed
+        const transcription = await streamTranscribeAudio(audioChunks, (partialText) => {
+            chatInput.value = partialText;
+        });
+        chatInput.value = '';
 
         if (transcription) {
             await sendChatMessage(true,transcription);  // Send as audio if transcription is successful